@@ -0,0 +1,4 @@
+import sys
+from Filters.cli import main
+
+sys.exit(main())
@@ -0,0 +1,452 @@
+"""
+    Cache
+
+    A Python program to keep the arrays most recently built by the filters in
+    memory, within a memory budget, so grids sharing the same geometry reuse
+    them, and to keep filter results on disk between runs (ResultCache).
+
+    Author: Joshua Poirier, 2017
+"""
+
+import os
+import json
+import time
+import hashlib
+import weakref
+from collections import OrderedDict
+import numpy as np
+
+def read_only(value):
+    """
+    Marks an array, or every array of a tuple, as read-only.
+
+    Arguments:
+        * value: array or tuple of arrays
+
+    Returns:
+        * value: the same object, read-only.
+    """
+
+    for a in (value if isinstance(value, tuple) else (value,)):
+        if isinstance(a, np.ndarray):
+            a.setflags(write=False)
+
+    return value
+
+def immutable(a):
+    """
+    Checks that an array cannot change: neither it nor any array or buffer it
+    views is writable, e.g. a grid opened with gridio.open_grid (mode 'r') or
+    a read-only array owning its data. A read-only view of a writable array
+    can still change through its base.
+
+    Arguments:
+        * a: array
+
+    Returns:
+        * immutable: bool
+    """
+
+    while isinstance(a, np.ndarray):
+        if a.flags.writeable:
+            return False
+        a = a.base
+    if a is None:
+        return True
+    try:
+        return memoryview(a).readonly
+    except TypeError:
+        return False
+
+def nbytes(value):
+    """
+    Calculates the memory held by an array or a tuple of arrays.
+
+    Arguments:
+        * value: array or tuple of arrays
+
+    Returns:
+        * n: int
+            Number of bytes.
+    """
+
+    return sum(np.asarray(a).nbytes
+               for a in (value if isinstance(value, tuple) else (value,)))
+
+class LRUCache(object):
+    """
+    Least-recently-used cache of arrays bounded by their total size. Values
+    larger than the whole budget are built but never stored.
+
+    Arguments:
+        * max_bytes: int
+            Memory budget in bytes. Defaults to 256 MiB.
+
+    Attributes:
+        * nbytes: int
+            Memory currently held.
+        * hits, misses: int
+            Lookup statistics.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20):
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, build):
+        """
+        Returns the value stored under 'key', building and storing it with
+        'build()' if needed. Built arrays are made read-only.
+
+        Arguments:
+            * key: hashable
+                The cache key.
+            * build: callable
+                Function without arguments returning an array or a tuple of
+                arrays.
+
+        Returns:
+            * value: array or tuple of arrays
+        """
+
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+        self.misses += 1
+        value = read_only(build())
+        self.put(key, value)
+
+        return value
+
+    def put(self, key, value, size=None):
+        """
+        Stores 'value' under 'key', evicting the least recently used values
+        until it fits in the memory budget.
+
+        Arguments:
+            * key: hashable
+                The cache key.
+            * value: array or tuple of arrays
+                The value to store.
+            * size: int
+                Memory held by the value. Defaults to the size of its arrays.
+        """
+
+        size = nbytes(value) if size is None else size
+        if size > self.max_bytes:
+            return
+
+        self.pop(key)
+        while self._items and self.nbytes + size > self.max_bytes:
+            self.pop(next(iter(self._items)))
+
+        self._items[key] = (value, size)
+        self.nbytes += size
+
+    def pop(self, key):
+        """
+        Removes 'key' from the cache, if present, and returns its value.
+        """
+
+        if key not in self._items:
+            return None
+
+        value, size = self._items.pop(key)
+        self.nbytes -= size
+
+        return value
+
+    def clear(self):
+        """
+        Removes every value from the cache.
+        """
+
+        self._items.clear()
+        self.nbytes = 0
+
+# the cache of wavenumber and filter-kernel grids shared by every filter
+kernel_cache = LRUCache()
+
+def digest(a):
+    """
+    Hashes the content, type and shape of an array (BLAKE2, reading the data
+    once without copying contiguous arrays).
+
+    Arguments:
+        * a: array
+
+    Returns:
+        * digest: str
+            Hexadecimal digest.
+    """
+
+    a = np.ascontiguousarray(a)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((a.dtype.str, a.shape)).encode())
+    h.update(a.reshape(-1).view(np.uint8))
+
+    return h.hexdigest()
+
+class ResultCache(object):
+    """
+    On-disk cache of filter results, kept between runs, within a disk budget.
+
+    Each entry is stored as one .npy file per output array, opened again as
+    read-only np.memmap, plus a small JSON file written last, so interrupted
+    writes are never read. The least recently used entries are evicted when
+    the budget is exceeded. An optional in-memory LRU layer (see LRUCache)
+    also keeps the most recent results.
+
+    Keys are built by 'key' from the content hash of the input arrays and the
+    full set of parameters (see registry.result_key), salted with the version
+    of the stored results, so entries made by older filter code are never
+    returned (they are evicted in time like any unused entry).
+
+    Temporary files left by interrupted writes are removed when evicting,
+    once they are older than 'stale_seconds'.
+
+    Arguments:
+        * path: str
+            Directory of the cache, created if needed.
+        * max_bytes: int
+            Disk budget in bytes. Defaults to 4 GiB.
+        * memory_bytes: int
+            Memory budget of the in-memory layer in bytes. Defaults to 0 (no
+            in-memory layer).
+
+    Attributes:
+        * hits, misses: int
+            Lookup statistics.
+    """
+
+    # bump whenever the results of existing filters change, e.g. when the
+    # spectral derivative kernels gained their 2*pi factors
+    version = 2
+
+    # age after which a temporary file is left over from an interrupted write
+    stale_seconds = 3600
+
+    def __init__(self, path, max_bytes=4 * 2**30, memory_bytes=0):
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory = LRUCache(memory_bytes) if memory_bytes else None
+        self.hits = 0
+        self.misses = 0
+
+        # digests of arrays which cannot change (see immutable), by array id.
+        # An entry is dropped when its array is garbage collected.
+        self._digests = {}
+
+    def digest(self, a):
+        """
+        Hashes an array (see digest). The digest of an array which cannot
+        change (see immutable), e.g. a grid opened with gridio.open_grid, is
+        only calculated once.
+        """
+
+        if isinstance(a, np.ndarray) and immutable(a):
+            ref, value = self._digests.get(id(a), (None, None))
+            if ref is not None and ref() is a:
+                return value
+            value = digest(a)
+            digests, key = self._digests, id(a)
+
+            def forget(ref):
+                if digests.get(key, (None,))[0] is ref:
+                    del digests[key]
+
+            digests[key] = (weakref.ref(a, forget), value)
+            return value
+
+        return digest(a)
+
+    def key(self, *parts):
+        """
+        Builds a cache key from arrays, hashed by content, and any other
+        values, hashed by their repr (which must not depend on the run, e.g.
+        numbers, strings, tuples, GridGeometry).
+
+        Returns:
+            * key: str
+        """
+
+        h = hashlib.blake2b(digest_size=20)
+        h.update(b'version:%d\0' % self.version)
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                h.update(b'array:' + self.digest(part).encode())
+            else:
+                h.update(repr(part).encode())
+            h.update(b'\0')
+
+        return h.hexdigest()
+
+    def _file(self, key, i):
+        return os.path.join(self.path, '%s.%d.npy' % (key, i))
+
+    def _meta(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def load(self, key):
+        """
+        Returns the value stored under 'key', or None if there is none.
+        """
+
+        if self.memory is not None and key in self.memory:
+            return self.memory.get(key, None)
+
+        meta = self._meta(key)
+        try:
+            with open(meta) as fh:
+                info = json.load(fh)
+            arrays = tuple(np.load(self._file(key, i), mmap_mode='r')
+                           for i in range(info['outputs']))
+            os.utime(meta, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        value = arrays if info['tuple'] else arrays[0]
+        if self.memory is not None:
+            self.memory.put(key, value)
+
+        return value
+
+    def put(self, key, value):
+        """
+        Stores an array or a tuple of arrays under 'key', then evicts the
+        least recently used entries beyond the disk budget.
+        """
+
+        arrays = value if isinstance(value, tuple) else (value,)
+        for i, a in enumerate(arrays):
+            tmp = self._file(key, i) + '.tmp'
+            with open(tmp, 'wb') as fh:
+                np.save(fh, a)
+            os.replace(tmp, self._file(key, i))
+
+        tmp = self._meta(key) + '.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump({'outputs': len(arrays),
+                       'tuple': isinstance(value, tuple)}, fh)
+        os.replace(tmp, self._meta(key))
+
+        # the in-memory layer holds read-only copies, so the caller may
+        # modify its own arrays
+        if self.memory is not None:
+            copies = tuple(np.array(a) for a in arrays)
+            self.memory.put(key, read_only(copies if isinstance(value, tuple)
+                                           else copies[0]))
+        self.evict()
+
+    def get(self, key, build):
+        """
+        Returns the value stored under 'key', building and storing it with
+        'build()' if needed.
+
+        Arguments:
+            * key: str
+                The cache key (see key).
+            * build: callable
+                Function without arguments returning an array or a tuple of
+                arrays.
+
+        Returns:
+            * value: array or tuple of arrays
+        """
+
+        value = self.load(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = build()
+        self.put(key, value)
+
+        return value
+
+    def entries(self):
+        """
+        Lists the stored entries, least recently used first.
+
+        Returns:
+            * entries: list of (key, nbytes)
+        """
+
+        sizes, times = {}, {}
+        for name in os.listdir(self.path):
+            key, _, ext = name.partition('.')
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            sizes[key] = sizes.get(key, 0) + stat.st_size
+            if ext == 'json':
+                times[key] = stat.st_mtime
+
+        return [(key, sizes[key]) for key in sorted(times, key=times.get)]
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size in self.entries())
+
+    def pop(self, key):
+        """
+        Removes an entry from the cache.
+        """
+
+        if self.memory is not None:
+            self.memory.pop(key)
+        for name in os.listdir(self.path):
+            if name.startswith(key + '.'):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def evict(self):
+        """
+        Removes the stale temporary files, then the least recently used entries
+        until the cache fits in its disk budget.
+        """
+
+        now = time.time()
+        for name in os.listdir(self.path):
+            if name.endswith('.tmp'):
+                path = os.path.join(self.path, name)
+                try:
+                    if now - os.path.getmtime(path) > self.stale_seconds:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+        entries = self.entries()
+        total = sum(size for _, size in entries)
+        for key, size in entries:
+            if total <= self.max_bytes:
+                break
+            self.pop(key)
+            total -= size
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+
+        for key, _ in self.entries():
+            self.pop(key)
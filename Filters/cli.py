@@ -0,0 +1,315 @@
+"""
+    Command Line
+
+    A Python program to run suites of filters over many survey grids from a
+    manifest, e.g. in a nightly pipeline:
+
+        python -m Filters run manifest.yaml
+
+    The manifest (YAML or JSON) lists the input grids and the attributes to
+    calculate:
+
+        output: results            # output directory
+        workers: 4                 # processes (defaults to the CPUs)
+        grid:                      # SpectralGrid options (optional)
+          n_pts: 10
+          mode: linear_ramp
+          fast_len: false
+          dtype: float32
+        inputs:                    # paths or glob patterns, relative to the
+          - surveys/*.grd          # manifest; text surveys (.dat) are
+          - Filters/data.dat       # converted to binary grids on first use
+          - {path: /data/tf.grd, id: north}
+        attributes:                # registered filters (see registry)
+          - dz: {n: [1, 1.5, 2]}   # list parameters expand into one job per
+          - dh                     # value, zipped with each other
+          - dt
+          - tilt
+          - hta: {k: 0.25}
+          - nss
+          - pss: {hc: [500, 1000], hf: [450, 900]}
+
+    Each job writes one binary grid (see gridio) with a band per filter
+    output, '<output>/<survey>/<filter label>.grd'. The survey is the input
+    path relative to the manifest without its extension (e.g. 'surveys/a',
+    or the absolute path for inputs outside the manifest directory), or the
+    'id' given for the input. Inputs with the same survey are refused, as
+    their outputs would collide. Each output is written to a temporary file
+    and renamed when complete, so an existing output is always whole: after
+    a crash, running the manifest again only calculates the missing outputs.
+
+    The jobs of a survey run in the same process and share its forward
+    transform. With fewer surveys than workers, the jobs of each survey are
+    split among several processes.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import os
+import sys
+import glob
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Filters import gridio
+from Filters.spectral import SpectralGrid
+from Filters.registry import get_filter, run_filter, filter_label
+
+def read_manifest(path):
+    """
+    Reads a manifest, in YAML (.yaml, .yml, requires PyYAML) or JSON.
+
+    Arguments:
+        * path: str
+            Path of the manifest.
+
+    Returns:
+        * manifest: dict
+    """
+
+    with open(path) as fh:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            manifest = yaml.safe_load(fh)
+        else:
+            manifest = json.load(fh)
+
+    for key in ('inputs', 'attributes'):
+        if not manifest.get(key):
+            raise ValueError("The manifest '%s' has no '%s'" % (path, key))
+
+    return manifest
+
+def survey_id(path, root='.'):
+    """
+    Names the survey of an input path: the path relative to 'root' without
+    its extension, or the absolute path (without its leading separator) for
+    inputs outside 'root'.
+    """
+
+    survey = os.path.relpath(path, root)
+    if survey.split(os.sep)[0] == os.pardir:
+        survey = os.path.splitdrive(os.path.abspath(path))[1].lstrip(os.sep)
+
+    return os.path.splitext(survey)[0]
+
+def input_paths(inputs, root='.'):
+    """
+    Expands the inputs of a manifest into surveys. A text survey and its
+    binary conversion (see gridio.open_grid) count once.
+
+    Arguments:
+        * inputs: list
+            Paths or glob patterns, relative to 'root', or {path, id}
+            mappings naming the survey of a single path.
+        * root: str
+            Directory of the manifest.
+
+    Returns:
+        * surveys: list of (survey, path)
+    """
+
+    paths, ids = [], {}
+    for spec in inputs:
+        pattern = spec['path'] if isinstance(spec, dict) else spec
+        matches = sorted(glob.glob(os.path.join(root, pattern)))
+        if not matches:
+            raise ValueError("No input matches '%s'" % pattern)
+        if isinstance(spec, dict) and 'id' in spec:
+            if len(matches) > 1:
+                raise ValueError("The input '%s' with id '%s' matches several "
+                                 "files" % (pattern, spec['id']))
+            survey = os.path.normpath(str(spec['id']))
+            if (os.path.isabs(survey)
+                    or survey.split(os.sep)[0] in (os.pardir, os.curdir)):
+                raise ValueError("Invalid survey id '%s'" % spec['id'])
+            ids[matches[0]] = survey
+        paths.extend(path for path in matches if path not in paths)
+
+    paths = [path for path in paths if not (path.endswith('.grd')
+             and path[:-4] + '.dat' in paths)]
+
+    surveys, seen = [], {}
+    for path in paths:
+        survey = ids.get(path) or survey_id(path, root)
+        if survey in seen:
+            raise ValueError("The inputs '%s' and '%s' would write the same "
+                             "outputs, '%s'" % (seen[survey], path, survey))
+        seen[survey] = path
+        surveys.append((survey, path))
+
+    return surveys
+
+def attribute_jobs(attributes):
+    """
+    Expands the attributes of a manifest into (name, params) jobs. The
+    parameters given as lists are expanded together, one job per value.
+
+    Arguments:
+        * attributes: list
+            Filter names, or {name: params} mappings.
+
+    Returns:
+        * jobs: list of (name, params)
+    """
+
+    jobs = []
+    for spec in attributes:
+        items = spec.items() if isinstance(spec, dict) else [(spec, None)]
+        for name, params in items:
+            get_filter(name)
+            params = dict(params or {})
+            lists = dict((k, v) for k, v in params.items()
+                         if isinstance(v, list))
+            sizes = set(len(v) for v in lists.values())
+            if len(sizes) > 1:
+                raise ValueError("The list parameters of '%s' have different "
+                                 "lengths" % name)
+            for i in range(sizes.pop() if sizes else 1):
+                job = dict(params)
+                job.update((k, v[i]) for k, v in lists.items())
+                jobs.append((name, job))
+
+    return jobs
+
+def output_path(out_dir, survey, name, params):
+    """
+    Names the output of a job, '<out_dir>/<survey>/<filter label>.grd'.
+    """
+
+    return os.path.join(out_dir, survey,
+                        filter_label(name, params) + '.grd')
+
+def run_jobs(survey, path, jobs, out_dir, options):
+    """
+    Worker task: runs jobs on one survey, sharing its forward transform, and
+    writes each output atomically (see the module documentation).
+
+    Arguments:
+        * survey: str
+            Name of the survey (see survey_id).
+        * path: str
+            Path of the survey (see gridio.open_grid).
+        * jobs: list of (name, params)
+            The jobs to run.
+        * out_dir: str
+            Output directory.
+        * options: dict
+            SpectralGrid options.
+
+    Returns:
+        * paths: list of str
+            Paths of the outputs written.
+    """
+
+    tf, geometry = gridio.open_grid(path)
+    grid = SpectralGrid(tf, geometry, **options)
+
+    paths = []
+    for name, params in jobs:
+        dst = output_path(out_dir, survey, name, params)
+        if os.path.exists(dst):
+            continue
+
+        _, outputs = get_filter(name)
+        results = run_filter(name, grid, **params)
+        tmp = '%s.%d.tmp' % (dst, os.getpid())
+        gridio.write_grid(tmp, np.stack(results), geometry, list(outputs))
+        os.replace(tmp, dst)
+        paths.append(dst)
+
+    return paths
+
+def schedule(manifest, root='.', workers=None, dry_run=False):
+    """
+    Runs the pending jobs of a manifest in a pool of processes.
+
+    Arguments:
+        * manifest: dict
+            The manifest (see the module documentation).
+        * root: str
+            Directory the paths of the manifest are relative to.
+        * workers: int
+            Number of processes. Defaults to the manifest 'workers', or to
+            the number of CPUs.
+        * dry_run: bool
+            Only list the pending jobs.
+
+    Returns:
+        * pending: dict
+            The pending jobs of each (survey, path).
+    """
+
+    out_dir = os.path.join(root, manifest.get('output', 'output'))
+    workers = workers or manifest.get('workers') or os.cpu_count()
+    options = dict(manifest.get('grid') or {})
+    jobs = attribute_jobs(manifest['attributes'])
+
+    pending = {}
+    for survey, path in input_paths(manifest['inputs'], root):
+        todo = [(name, params) for name, params in jobs
+                if not os.path.exists(output_path(out_dir, survey, name,
+                                                  params))]
+        if todo:
+            pending[survey, path] = todo
+    if dry_run or not pending:
+        return pending
+
+    for survey, path in pending:
+        if not os.path.isdir(os.path.join(out_dir, survey)):
+            os.makedirs(os.path.join(out_dir, survey))
+
+        # binary grids are converted here, not concurrently by several workers
+        if path.endswith('.dat'):
+            gridio.open_grid(path)
+
+    # split the jobs of each survey when there are fewer surveys than workers
+    parts = max(1, -(-workers // len(pending)))
+    tasks = [(survey, path, todo[i::parts])
+             for (survey, path), todo in pending.items()
+             for i in range(parts) if todo[i::parts]]
+
+    with ProcessPoolExecutor(min(workers, len(tasks))) as pool:
+        futures = [pool.submit(run_jobs, survey, path, todo, out_dir, options)
+                   for survey, path, todo in tasks]
+        for future in futures:
+            for dst in future.result():
+                print(dst)
+
+    return pending
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        prog='python -m Filters',
+        description='Run filters over survey grids from a manifest.')
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='run the jobs of a manifest')
+    run.add_argument('manifest', help='YAML or JSON manifest')
+    run.add_argument('--workers', type=int,
+                     help='number of processes (overrides the manifest)')
+    run.add_argument('--dry-run', action='store_true',
+                     help='only list the pending jobs')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        manifest = read_manifest(args.manifest)
+        root = os.path.dirname(os.path.abspath(args.manifest))
+        pending = schedule(manifest, root, args.workers, args.dry_run)
+        if args.dry_run:
+            for (survey, path), todo in sorted(pending.items()):
+                for name, params in todo:
+                    print('%s: %s' % (survey, filter_label(name, params)))
+        elif not pending:
+            print('Nothing to do')
+    else:
+        parser.print_help()
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
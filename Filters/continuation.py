@@ -0,0 +1,194 @@
+"""
+    Continuation
+
+    A Python program to continue potential-field data upward or downward, to
+    one or several heights, from a single Fourier Transform of the data.
+
+    Continuing the data by a height h multiplies its spectrum by
+
+        exp(-2*pi*|k|*h)
+
+    (the Poisson kernel of the Poisson scale-space monogenic signal), where
+    |k| is the radial wavenumber in cycles per unit length and h > 0 is
+    upward, away from the sources. Downward continuation (h < 0) amplifies
+    the short wavelengths exponentially, noise included, and is only stable
+    over a few sample spacings.
+
+    A ContinuedGrid is the spectral context of the continued data, built from
+    the spectrum of the original data without a new forward transform, so
+    every filter accepting a SpectralGrid (derivatives, tilt angles, the
+    monogenic signal, the filter bank) runs at each height for the cost of
+    its inverse transforms.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import numpy as np
+from Filters.spectral import SpectralGrid, as_spectral_grid
+from Filters.registry import get_filter, run_filter
+from Filters.tiling import open_outputs
+
+def continuation_rate(grid):
+    """
+    Returns -2*pi*|k|, the logarithm of the continuation filter for a unit
+    height, of a SpectralGrid (from its kernel cache).
+    """
+
+    return grid.kernel('continuation', lambda: -2 * np.pi * grid.r)
+
+def continuation_kernel(grid, h):
+    """
+    Returns the wavenumber-domain filter continuing the data of a SpectralGrid
+    by a height h, exp(-2*pi*|k|*h).
+    """
+
+    return np.exp(continuation_rate(grid) * h)
+
+class ContinuedGrid(SpectralGrid):
+    """
+    The spectral context of data continued to another height, sharing the
+    padding, wavenumbers, kernels and FFT backend of the original grid. Its
+    spectrum is the continued spectrum of the original data, so no forward
+    transform is needed. The continued spatial-domain data (the 'data'
+    attribute) costs one inverse transform and is only calculated when a
+    filter uses it, e.g. the finite-difference horizontal derivatives.
+
+    Arguments:
+        * grid: SpectralGrid
+            The spectral context of the original data.
+        * h: float
+            Continuation height, positive upward.
+
+    Attributes:
+        * height: float
+            The continuation height, relative to the original data.
+        * Any attribute of SpectralGrid.
+    """
+
+    def __init__(self, grid, h):
+
+        self.__dict__.update(grid.__dict__)
+        self.__dict__.pop('data', None)
+        self.height = h + getattr(grid, 'height', 0)
+        self.F = continuation_kernel(grid, h) * grid.F
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self.inverse(1)
+        return self._data
+
+def continue_grid(f, x=None, y=None, h=0.):
+    """
+    Continues data by a height.
+
+    Arguments:
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * h: float
+            Continuation height, positive upward.
+
+    Returns:
+        * fh: 2d-array
+            The continued data.
+    """
+
+    grid = as_spectral_grid(f, x, y)
+
+    return grid.inverse(continuation_kernel(grid, h))
+
+def continuation_stack(f, x=None, y=None, heights=(0.,), out=None):
+    """
+    Continues data to several heights from a single Fourier Transform, with
+    one inverse transform per height.
+
+    Arguments:
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * heights: list of floats
+            Continuation heights, positive upward.
+        * out: None, str or array
+            Where to write the stack: None for an in-memory array, a .npy
+            path for a memory-mapped array, or a preallocated array.
+
+    Returns:
+        * stack: 3d-array
+            The continued data, with shape (height, ny, nx).
+    """
+
+    grid = as_spectral_grid(f, x, y)
+    rate = continuation_rate(grid)
+
+    shape = (len(heights),) + tuple(grid.shape)
+    stack = open_outputs(out, ('stack',), shape, grid.dtype)[0]
+
+    K = np.empty_like(rate)
+    for i, h in enumerate(heights):
+        np.multiply(rate, h, out=K)
+        np.exp(K, out=K)
+        stack[i] = grid.inverse(K)
+
+    if isinstance(stack, np.memmap):
+        stack.flush()
+
+    return stack
+
+def continued_filter(name, f, x=None, y=None, heights=(0.,), out=None,
+                     **params):
+    """
+    Runs a filter on data continued to several heights, e.g. the tilt angle
+    at 10 heights, from a single Fourier Transform of the data (see
+    ContinuedGrid).
+
+    Arguments:
+        * name: str or callable
+            Name of a registered filter (see registry), or a filter function
+            accepting a SpectralGrid.
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * heights: list of floats
+            Continuation heights, positive upward.
+        * out: None, str or arrays
+            Where to write the stacks: None for in-memory arrays, a .npy path
+            for memory-mapped arrays (see tiling.output_paths), or
+            preallocated arrays.
+        * params: keyword arguments
+            Parameters of the filter, e.g. k=0.5 for 'hta'.
+
+    Returns:
+        * stack: 3d-array, or tuple of 3d-arrays for filters with several
+            outputs, with shape (height, ny, nx).
+    """
+
+    _, outputs = get_filter(name)
+    grid = as_spectral_grid(f, x, y)
+
+    arrays = None
+    for i, h in enumerate(heights):
+        results = run_filter(name, ContinuedGrid(grid, h), **params)
+        if arrays is None:
+            shape = (len(heights),) + np.shape(results[0])
+            arrays = open_outputs(out, outputs, shape, results[0].dtype)
+        for array, result in zip(arrays, results):
+            array[i] = result
+
+    if arrays is None:
+        # no heights: empty stacks, as continuation_stack returns
+        shape = (0,) + tuple(grid.shape)
+        arrays = open_outputs(out, outputs, shape, grid.dtype)
+
+    for array in arrays:
+        if isinstance(array, np.memmap):
+            array.flush()
+
+    return arrays[0] if len(arrays) == 1 else tuple(arrays)
@@ -0,0 +1,239 @@
+"""
+    FFT Backends
+
+    A Python program to select the library computing the Fourier Transforms of
+    the filters, globally or per call.
+
+    Available backends:
+        'numpy': numpy.fft, single threaded. The default.
+        'scipy': scipy.fft, multithreaded through its 'workers' argument.
+        'pyfftw': pyFFTW, multithreaded, with plan caching and optional
+            wisdom files.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import os
+import pickle
+import numpy as np
+
+def smooth_len(n, primes=(2, 3, 5)):
+    """
+    Calculates the smallest length not less than 'n' whose prime factors are
+    all in 'primes' (5-smooth by default).
+
+    Arguments:
+        * n: int
+            Minimum length.
+        * primes: tuple of int
+            Allowed prime factors.
+
+    Returns:
+        * m: int
+            The smooth length.
+    """
+
+    m = max(int(n), 1)
+    while True:
+        k = m
+        for p in primes:
+            while k % p == 0:
+                k //= p
+        if k == 1:
+            return m
+        m += 1
+
+class NumpyBackend(object):
+    """
+    Fourier Transforms computed with numpy.fft.
+    """
+
+    name = 'numpy'
+
+    def next_fast_len(self, n, real=False):
+        return smooth_len(n)
+
+    def fft2(self, a):
+        return np.fft.fft2(a)
+
+    def ifft2(self, A):
+        return np.fft.ifft2(A)
+
+    def rfft2(self, a):
+        return np.fft.rfft2(a)
+
+    def irfft2(self, A, s):
+        return np.fft.irfft2(A, s=s)
+
+class ScipyBackend(object):
+    """
+    Fourier Transforms computed with scipy.fft.
+
+    Arguments:
+        * workers: int
+            Number of threads. Negative values count back from the number of
+            CPUs. Defaults to -1 (all of them).
+    """
+
+    name = 'scipy'
+
+    def __init__(self, workers=-1):
+
+        import scipy.fft
+        self.fft = scipy.fft
+        self.workers = workers
+
+    def next_fast_len(self, n, real=False):
+        return self.fft.next_fast_len(n, real)
+
+    def fft2(self, a):
+        return self.fft.fft2(a, workers=self.workers)
+
+    def ifft2(self, A):
+        return self.fft.ifft2(A, workers=self.workers)
+
+    def rfft2(self, a):
+        return self.fft.rfft2(a, workers=self.workers)
+
+    def irfft2(self, A, s):
+        return self.fft.irfft2(A, s=s, workers=self.workers)
+
+class PyFFTWBackend(object):
+    """
+    Fourier Transforms computed with pyFFTW. FFTW plans are cached between
+    calls of the same shape and type, and may be seeded from a wisdom file.
+
+    Arguments:
+        * threads: int
+            Number of threads. Defaults to the number of CPUs.
+        * planner_effort: str
+            FFTW planner flag. Defaults to 'FFTW_MEASURE'.
+        * wisdom: str
+            Optional path of a wisdom file, loaded if it exists and written by
+            save_wisdom.
+    """
+
+    name = 'pyfftw'
+
+    def __init__(self, threads=None, planner_effort='FFTW_MEASURE',
+                 wisdom=None):
+
+        import pyfftw
+        import pyfftw.interfaces.numpy_fft
+        self.pyfftw = pyfftw
+        self.fft = pyfftw.interfaces.numpy_fft
+        self.threads = threads or os.cpu_count() or 1
+        self.planner_effort = planner_effort
+        self.wisdom = wisdom
+
+        # keep the plans alive between calls
+        pyfftw.interfaces.cache.enable()
+
+        if wisdom is not None and os.path.exists(wisdom):
+            with open(wisdom, 'rb') as fh:
+                pyfftw.import_wisdom(pickle.load(fh))
+
+    def save_wisdom(self, path=None):
+        """
+        Writes the accumulated FFTW wisdom to 'path' (defaults to the wisdom
+        file given on creation).
+        """
+
+        with open(path or self.wisdom, 'wb') as fh:
+            pickle.dump(self.pyfftw.export_wisdom(), fh)
+
+    def next_fast_len(self, n, real=False):
+        return self.pyfftw.next_fast_len(n)
+
+    def fft2(self, a):
+        return self.fft.fft2(a, threads=self.threads,
+                             planner_effort=self.planner_effort)
+
+    def ifft2(self, A):
+        return self.fft.ifft2(A, threads=self.threads,
+                              planner_effort=self.planner_effort)
+
+    def rfft2(self, a):
+        return self.fft.rfft2(a, threads=self.threads,
+                              planner_effort=self.planner_effort)
+
+    def irfft2(self, A, s):
+        return self.fft.irfft2(A, s=s, threads=self.threads,
+                               planner_effort=self.planner_effort)
+
+# registered backend factories, keyed by name
+BACKENDS = {
+    'numpy': NumpyBackend,
+    'scipy': ScipyBackend,
+    'pyfftw': PyFFTWBackend,
+}
+
+# backend instances already created, keyed by name and options
+_instances = {}
+
+# the global default backend
+_default = [NumpyBackend()]
+
+def register_backend(name, factory):
+    """
+    Registers a new backend. The factory is called with the backend options
+    and must return an object with fft2, ifft2, rfft2, irfft2 and
+    next_fast_len methods.
+
+    Arguments:
+        * name: str
+            Name of the backend.
+        * factory: callable
+            Class or function creating the backend.
+    """
+
+    BACKENDS[name] = factory
+
+def get_backend(backend=None, **options):
+    """
+    Resolves a backend.
+
+    Arguments:
+        * backend: str, backend object or None
+            Name of a registered backend, a backend object (returned as is),
+            or None for the global default.
+        * options: keyword arguments
+            Options of a named backend, e.g. workers=8 for 'scipy'.
+
+    Returns:
+        * backend: backend object
+    """
+
+    if backend is None:
+        return _default[0]
+    if not isinstance(backend, str):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError("Unknown FFT backend '%s', expected one of %s"
+                         % (backend, ', '.join(sorted(BACKENDS))))
+
+    key = (backend, tuple(sorted(options.items())))
+    if key not in _instances:
+        _instances[key] = BACKENDS[backend](**options)
+
+    return _instances[key]
+
+def set_backend(backend, **options):
+    """
+    Sets the global default backend.
+
+    Arguments:
+        * backend: str or backend object
+            Name of a registered backend, or a backend object.
+        * options: keyword arguments
+            Options of a named backend, e.g. workers=8 for 'scipy'.
+
+    Returns:
+        * previous: backend object
+            The previous default, so it can be restored.
+    """
+
+    previous = _default[0]
+    _default[0] = get_backend(backend, **options)
+
+    return previous
@@ -1,100 +1,388 @@
 import numpy as np
+from Filters.fft_backends import get_backend
+from Filters.cache import kernel_cache
+from Filters.geometry import as_geometry
+from Filters import profiling
 
-def fft_wavenumbers(x, y, shape_dat, shape_pdat):
+def fft_wavenumbers(x, y, shape_dat, shape_pdat, real=False):
     """
     Calculates the u, v Fourier wavenumbers in the x and y directions
     respectively.
 
+    In half-spectrum mode only the non-negative x wavenumbers are kept,
+    matching the output of np.fft.rfft2. When the padded grid has an even
+    number of rows, one extra row is appended: the Nyquist row mirrored in x.
+    Filters built from these wavenumbers must go through fold_nyquist before
+    multiplying the spectrum.
+
     Arguments:
-        * x, y: 2d-arrays
+        * x, y: 2d-arrays, or GridGeometry and None
             Arrays with the x and y coordinates of the data points.
         * shape_dat: tube = (ny, nx)
             The number of data points in each direction before padding.
         * shape_pdat: tube = (ny, nx)
             The number of data points in each direction after padding.
+        * real: bool
+            Calculate the wavenumbers of the half-spectrum. Defaults to False.
 
     Returns:
         * u, v: 2d-arrays
-            x and y Fourier wavenumbers
+            x and y Fourier wavenumbers (read-only, see wavenumber_grids)
+    """
+
+    # the sample spacing in the x and y directions
+    dx, dy = as_geometry(x, y, shape_dat).spacing
+
+    u, v, _ = wavenumber_grids(dx, dy, shape_pdat, real)
+
+    return u, v
+
+def wavenumber_grids(dx, dy, shape_pdat, real=False):
+    """
+    Calculates the u, v and r Fourier wavenumbers in the x, y and radial
+    directions of a padded grid with the given sample spacing (see
+    fft_wavenumbers for their layout in half-spectrum mode).
+
+    The grids are kept in the kernel cache (see cache.py) and returned
+    read-only, so grids of the same geometry only build them once.
+
+    Arguments:
+        * dx, dy: floats
+            The sample spacing in the x and y directions.
+        * shape_pdat: tube = (ny, nx)
+            The number of data points in each direction after padding.
+        * real: bool
+            Calculate the wavenumbers of the half-spectrum. Defaults to False.
+
+    Returns:
+        * u, v, r: 2d-arrays
+            x, y and radial Fourier wavenumbers.
     """
 
-    # calculate the sample spacing in the x and y directions
-    dx = (np.amax(x) - np.amin(x)) / (shape_dat[1] - 1)
-    dy = (np.amax(y) - np.amin(y)) / (shape_dat[0] - 1)
+    def build():
+        t = profiling.start()
+        grids = _wavenumber_grids(dx, dy, shape_pdat, real)
+        profiling.stop('kernel', t)
+        return grids
+
+    key = ('wavenumbers', tuple(shape_pdat), dx, dy, real)
+
+    return kernel_cache.get(key, build)
+
+def _wavenumber_grids(dx, dy, shape_pdat, real):
+    """
+    Builds the wavenumber grids returned by wavenumber_grids.
+    """
 
     # calculate the DFT sample frequencies
     fx = np.fft.fftfreq(shape_pdat[1], dx)
     fy = np.fft.fftfreq(shape_pdat[0], dy)
 
+    if real:
+        # keep the non-negative x frequencies of the half-spectrum
+        fx = fx[:shape_pdat[1] // 2 + 1]
+
     # project the wavenumbers onto the grid
     u, v = np.meshgrid(fx, fy)
 
-    return u, v
+    if real and shape_pdat[0] % 2 == 0:
+        # append the Nyquist row mirrored in x
+        u = np.vstack([u, -fx])
+        v = np.vstack([v, np.full_like(fx, fy[shape_pdat[0] // 2])])
 
-def fft_pad_data(f, n_pts=10, mode='linear_ramp'):
+    # calculate the magnitude of the wavenumbers
+    r = (u**2 + v**2)**(0.5)
+
+    return u, v, r
+
+def fold_nyquist(K, shape_pdat):
     """
-    Pad data and calculate FFT.
+    Folds the mirrored Nyquist row of a half-spectrum filter (see
+    fft_wavenumbers) back onto the Nyquist row.
+
+    The full-spectrum path takes the real part of the inverse transform, which
+    implicitly keeps only the Hermitian part of the filter. On the Nyquist row
+    that part pairs each x wavenumber with its negative, which the
+    half-spectrum does not store. Averaging with the mirrored row restores it,
+    so filters such as i*v/|k| give the same result in both modes.
 
     Arguments:
-        * f: 2d-arrays
+        * K: 2d-array or scalar
+            Filter built from half-spectrum wavenumbers.
+        * shape_pdat: tube = (ny, nx)
+            The number of data points in each direction after padding.
+
+    Returns:
+        * K: 2d-array or scalar
+            Filter with the same shape as the half-spectrum.
+    """
+
+    ny = shape_pdat[0]
+    if np.ndim(K) < 2 or np.shape(K)[-2] == ny:
+        return K
+
+    Kf = K[..., :-1, :].copy()
+    Kf[..., ny // 2, :] = (K[..., ny // 2, :] + np.conj(K[..., -1, :])) / 2
+
+    return Kf
+
+def float_type(f, dtype=None):
+    """
+    Chooses the floating-point precision of the padded data, its spectrum and
+    the filters: single precision halves the memory and bandwidth of every
+    grid-sized array, and keeps about 7 significant digits, more than
+    potential-field data carry.
+
+    Arguments:
+        * f: array
             Array with the gridded data.
+        * dtype: data type
+            Requested precision, e.g. np.float32. Defaults to single precision
+            for single-precision data, and double precision otherwise.
+
+    Returns:
+        * dtype: np.dtype
+            np.float32 or np.float64. The spectrum has the matching complex
+            type.
+    """
+
+    if dtype is None:
+        dtype = getattr(f, 'dtype', np.float64)
+    if np.dtype(dtype) in (np.float16, np.float32, np.complex64):
+        return np.dtype(np.float32)
+
+    return np.dtype(np.float64)
+
+class PadDescriptor(object):
+    """
+    Location of the data within a padded grid, given by the number of padding
+    points before and after the data in each direction (possibly different,
+    as with fast FFT lengths).
+
+    It replaces the boolean mask of the padded grid: the data is cut out with
+    slices, a view, instead of a gather. The mask is still built on request,
+    through the mask attribute or np.asarray, so the descriptor can be used
+    wherever the mask was, e.g. fp[pad].
+
+    Arguments:
+        * shape_dat: tuple = (ny, nx)
+            The number of data points in each direction before padding.
+        * widths: tuple = ((before_y, after_y), (before_x, after_x))
+            The number of padding points in each direction (see pad_widths).
+
+    Attributes:
+        * shape: tuple = (ny, nx)
+            The number of data points in each direction after padding.
+        * offsets: tuple = (before_y, before_x)
+            Index of the first data point in the padded grid.
+        * slices: tuple of slices
+            The data points in the padded grid.
+    """
+
+    __slots__ = ('shape_dat', 'widths')
+
+    ndim = 2
+
+    def __init__(self, shape_dat, widths):
+
+        self.shape_dat = tuple(shape_dat)
+        self.widths = tuple(tuple(w) for w in widths)
+
+    def __repr__(self):
+        return 'PadDescriptor(shape_dat=%r, widths=%r)' \
+            % (self.shape_dat, self.widths)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.mask if dtype is None else self.mask.astype(dtype)
+
+    @property
+    def shape(self):
+        return tuple(n + b + a for n, (b, a) in zip(self.shape_dat,
+                                                    self.widths))
+
+    @property
+    def offsets(self):
+        return tuple(b for b, _ in self.widths)
+
+    @property
+    def slices(self):
+        return tuple(slice(b, b + n) for n, (b, _) in zip(self.shape_dat,
+                                                          self.widths))
+
+    @property
+    def mask(self):
+        mask = np.zeros(self.shape, dtype=bool)
+        mask[self.slices] = True
+        return mask
+
+    def unpad(self, fp):
+        """
+        Cuts the data out of a padded grid (or of a stack of padded grids,
+        along the last two axes).
+
+        Arguments:
+            * fp: array
+                The padded grid(s).
+
+        Returns:
+            * f: array
+                A view of the data points.
+        """
+
+        return fp[(Ellipsis,) + self.slices]
+
+def pad_widths(shape_dat, n_pts=10, fast_len=False, real=False, backend=None):
+    """
+    Calculates the number of padding points before and after the data in each
+    direction.
+
+    By default the data is padded with exactly 'n_pts' points on every side.
+    With 'fast_len', each direction is instead grown to the next length the
+    FFT backend transforms fast (5-smooth for numpy), with at least 'n_pts'
+    points on every side. The extra points are split as evenly as possible,
+    the odd one going after the data.
+
+    Arguments:
+        * shape_dat: tube = (ny, nx)
+            The number of data points in each direction before padding.
         * n_pts: int
-            Number of array points to pad the data with. Defaults to 10.
+            Number (or minimum number) of padding points. Defaults to 10.
+        * fast_len: bool
+            Grow each direction to a fast FFT length. Defaults to False.
+        * real: bool
+            The padded data will be transformed with rfft2. Defaults to False.
+        * backend: str or backend object
+            FFT backend (see fft_backends). Defaults to the global default.
+
+    Returns:
+        * widths: tuple = ((before_y, after_y), (before_x, after_x))
+            The number of padding points in each direction.
+    """
+
+    if not fast_len:
+        return ((n_pts, n_pts), (n_pts, n_pts))
+
+    backend = get_backend(backend)
+    widths = []
+    for axis, n in enumerate(shape_dat):
+        total = backend.next_fast_len(n + 2*n_pts,
+                                      real and axis == len(shape_dat) - 1) - n
+        widths.append((total // 2, total - total // 2))
+
+    return tuple(widths)
+
+def fft_pad_data(f, n_pts=10, mode='linear_ramp', real=False, backend=None,
+                 fast_len=False, dtype=None):
+    """
+    Pad data and calculate FFT.
+
+    Arguments:
+        * f: 2d-array or 3d-array
+            Array with the gridded data, or a stack of grids of the same
+            shape with shape (batch, ny, nx), padded along the last two axes
+            and transformed together.
+        * n_pts: int
+            Number of array points to pad the data with. Defaults to 10. With
+            'fast_len', the minimum number of points on each side.
         * mode: str
             Padding mode: {
                 'linear_ramp': Pads with a linear ramp between edge value and 0.
                 'edge': Pads with the edge values of the data.
                 'mean': Pads with the mean value of all the data.
             }
+        * real: bool
+            Calculate only the half-spectrum of the real data with
+            np.fft.rfft2. Defaults to False.
+        * backend: str or backend object
+            FFT backend (see fft_backends). Defaults to the global default.
+        * fast_len: bool
+            Grow each direction to a fast FFT length (see pad_widths).
+            Defaults to False.
+        * dtype: data type
+            Precision of the padded data and its FFT (see float_type).
+            Defaults to the precision of 'f'.
 
     Returns:
 
-        * fpad: 2d-array
+        * fpad: 2d-array or 3d-array
             The FFT of the padded data.
-        * mask: 2d-array
-            Location of the padding points: {
+        * pad: PadDescriptor
+            Location of the data points in the padded grid. It converts to the
+            former mask: {
                 True: data points.
                 False: padded points.
             }
     """
 
-    # pad the data
-    fp = np.pad(f, n_pts, mode)
+    backend = get_backend(backend)
+    dtype = float_type(f, dtype)
+
+    # pad the data along the last two axes
+    t = profiling.start()
+    shape_dat = np.shape(f)[-2:]
+    widths = pad_widths(shape_dat, n_pts, fast_len, real, backend)
+    stack = ((0, 0),) * (np.ndim(f) - 2)
+    fp = np.pad(np.asarray(f, dtype), stack + widths, mode)
 
-    # create a data mask
-    mask = np.zeros_like(fp, dtype=bool)
-    mask[n_pts:n_pts+np.shape(f)[0], n_pts:n_pts+np.shape(f)[1]] = True
+    # describe the location of the data
+    pad = PadDescriptor(shape_dat, widths)
+    profiling.stop('pad', t)
 
-    # compute the FFT
-    F = np.fft.fft2(fp)
+    # compute the FFT, in the precision of the data
+    t = profiling.start()
+    if real:
+        F = backend.rfft2(fp)
+    else:
+        F = backend.fft2(fp)
+    F = F.astype(np.result_type(dtype, np.complex64), copy=False)
+    profiling.stop('fft', t)
 
-    return F, mask
+    return F, pad
 
-def ifft_unpad_data(F, mask, shape_dat):
+def ifft_unpad_data(F, mask, shape_dat, real=False, backend=None):
     """
     Calculates the Inverse Fourier Transform of a padded 2d-array and masks the
-    data to the original shape.
+    data to the original shape. A stack of spectra (any number of leading
+    axes) is transformed at once.
 
     Arguments:
         * F: 2d-array
             Array with the padded data in the wavenumber domain.
-        * mask: 2d-array
-            Location of padding points: {
+        * mask: PadDescriptor or 2d-array
+            Location of the data points (see fft_pad_data), or a mask of the
+            padding points: {
                 True: Points to be kept.
                 False: Points to be removed.
             }
         * shape_dat: tube = (ny, nx)
             The number of data points in each direction before padding.
+        * real: bool
+            'F' is a half-spectrum, inverted with np.fft.irfft2. Defaults to
+            False.
+        * backend: str or backend object
+            FFT backend (see fft_backends). Defaults to the global default.
 
     Returns:
         * data: 2d-array
             The unpadded spatial-domain data.
     """
 
-    # calculate the Inverse Fourier Transform
-    fp = np.real(np.fft.ifft2(F))
+    # calculate the Inverse Fourier Transform, in the precision of 'F'
+    t = profiling.start()
+    backend = get_backend(backend)
+    if real:
+        fp = backend.irfft2(F, s=mask.shape)
+    else:
+        fp = np.real(backend.ifft2(F))
+    fp = fp.astype(np.finfo(F.dtype).dtype, copy=False)
+    profiling.stop('ifft', t)
 
-    # mask the data to the original shape
-    f = np.reshape(fp[mask], shape_dat)
+    # cut the data out in a single contiguous copy (or gather it with a mask)
+    t = profiling.start()
+    if isinstance(mask, PadDescriptor):
+        f = np.ascontiguousarray(mask.unpad(fp))
+    else:
+        f = np.reshape(fp[..., mask], fp.shape[:-2] + tuple(shape_dat))
+    profiling.stop('unpad', t)
 
     return f
@@ -0,0 +1,148 @@
+"""
+    Filter Bank
+
+    A Python program to calculate several edge-detection attributes of a
+    2d-array in one pass, sharing every intermediate derivative between them.
+
+    Author: Joshua Poirier, 2017
+"""
+
+from Filters.spectral import as_spectral_grid
+from Filters.horizontal import dh, dxdy_conv
+from Filters.vertical import dz
+from Filters.total import dt
+from Filters.tilt import tilt, hyperbolic_tilt
+from Filters.registry import source_parts
+
+# Dependency graph of the attributes. Each entry maps an attribute (or shared
+# intermediate) to the names it depends on and a function computing it from
+# the source data (f, x, y), the parameters, and the dependencies in order.
+GRAPH = {
+    'spectrum': ((), lambda src, prm: as_spectral_grid(*src)),
+    'dxdy': ((), lambda src, prm: dxdy_conv(*src)),
+    'dx': (('dxdy',), lambda src, prm, dxdy: dxdy[0]),
+    'dy': (('dxdy',), lambda src, prm, dxdy: dxdy[1]),
+    'dz': (('spectrum',), lambda src, prm, grid: dz(grid)),
+    'dh': (('dxdy',),
+           lambda src, prm, dxdy: dh(None, dfdx=dxdy[0], dfdy=dxdy[1])),
+    'dt': (('dxdy', 'dz'),
+           lambda src, prm, dxdy, dfdz: dt(None, dfdx=dxdy[0], dfdy=dxdy[1],
+                                           dfdz=dfdz)),
+    'tilt': (('dh', 'dz'),
+             lambda src, prm, dfdh, dfdz: tilt(None, dfdh=dfdh, dfdz=dfdz)),
+    'hta': (('dh', 'dz'),
+            lambda src, prm, dfdh, dfdz: hyperbolic_tilt(None, k=prm['k'],
+                                                         dfdh=dfdh,
+                                                         dfdz=dfdz)),
+}
+
+ATTRIBUTES = ('dx', 'dy', 'dz', 'dh', 'dt', 'tilt', 'hta')
+
+def evaluation_order(attrs):
+    """
+    Resolves the dependency graph of the requested attributes.
+
+    Arguments:
+        * attrs: list of str
+            Names of the requested attributes.
+
+    Returns:
+        * order: list of str
+            Every attribute and intermediate to compute, each listed after its
+            dependencies.
+    """
+
+    order = []
+
+    def visit(name):
+        if name in order:
+            return
+        if name not in GRAPH:
+            raise ValueError("Unknown attribute '%s', expected one of %s"
+                             % (name, ', '.join(ATTRIBUTES)))
+        for dep in GRAPH[name][0]:
+            visit(dep)
+        order.append(name)
+
+    for name in attrs:
+        visit(name)
+
+    return order
+
+def compute_edge_attributes(f, x=None, y=None, attrs=ATTRIBUTES, k=0.25,
+                            cache=None):
+    """
+    Calculates several edge-detection attributes of a 2d-array at once. Each
+    shared derivative (e.g. the first vertical derivative used by the total
+    derivative, the tilt and the hyperbolic tilt) is calculated once, and
+    every intermediate is released as soon as no remaining attribute needs it.
+
+    Available attributes:
+        'dx', 'dy': first-order partial derivatives in the x and y directions.
+        'dz': first vertical derivative.
+        'dh': total horizontal derivative.
+        'dt': total derivative (analytic signal).
+        'tilt': tilt angle.
+        'hta': hyperbolic tilt angle.
+
+    Arguments:
+        * f: 2d-array or SpectralGrid
+            Array with the data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * attrs: list of str
+            Names of the attributes to calculate. Defaults to all of them.
+        * k: float
+            Stabilizing constant of the hyperbolic tilt angle. Defaults to
+            0.25.
+        * cache: ResultCache
+            Optional cache of results (see cache.py). Only the attributes not
+            already cached for the same data and parameters are calculated.
+
+    Returns:
+        * results: dict
+            The requested attributes keyed by name.
+    """
+
+    found = {}
+    if cache is not None:
+        parts = source_parts(f, x, y)
+        keys = dict((name, cache.key('edge', name,
+                                     k if name == 'hta' else None, *parts))
+                    for name in attrs)
+        for name in attrs:
+            value = cache.load(keys[name])
+            if value is not None:
+                found[name] = value
+        cache.hits += len(found)
+        cache.misses += len(attrs) - len(found)
+
+    src = (f, x, y)
+    prm = {'k': k}
+    order = evaluation_order([name for name in attrs if name not in found])
+
+    # count the remaining consumers of every node so intermediates can be
+    # released after their last use
+    consumers = dict((name, 0) for name in order)
+    for name in order:
+        for dep in GRAPH[name][0]:
+            consumers[dep] += 1
+
+    results = {}
+    for name in order:
+        deps, func = GRAPH[name]
+        results[name] = func(src, prm, *[results[dep] for dep in deps])
+
+        for dep in deps:
+            consumers[dep] -= 1
+            if consumers[dep] == 0 and dep not in attrs:
+                del results[dep]
+
+    for name in attrs:
+        if name in found:
+            results[name] = found[name]
+        elif cache is not None:
+            cache.put(keys[name], results[name])
+
+    return dict((name, results[name]) for name in attrs)
@@ -0,0 +1,153 @@
+"""
+    Geometry
+
+    A Python program to describe a regular grid by its origin, sample spacing
+    and shape, in place of the full x and y coordinate arrays.
+
+    Every filter accepts a GridGeometry as its 'x' argument (with 'y' left as
+    None) wherever it accepts coordinate arrays. The arrays are only built on
+    request, e.g. for plotting.
+
+    As in the filters, x increases along the columns (axis 1) and y along the
+    rows (axis 0).
+
+    Author: Joshua Poirier, 2017
+"""
+
+import numpy as np
+
+class GridGeometry(object):
+    """
+    Origin, sample spacing and shape of a regular grid.
+
+    Arguments:
+        * origin: tuple = (x0, y0)
+            Coordinates of the first data point.
+        * spacing: tuple = (dx, dy)
+            The sample spacing in the x and y directions.
+        * shape: tuple = (ny, nx)
+            The number of data points in each direction.
+    """
+
+    __slots__ = ('origin', 'spacing', 'shape')
+
+    def __init__(self, origin, spacing, shape):
+
+        self.origin = tuple(float(o) for o in origin)
+        self.spacing = tuple(float(s) for s in spacing)
+        self.shape = tuple(int(n) for n in shape)
+
+    def __repr__(self):
+        return 'GridGeometry(origin=%r, spacing=%r, shape=%r)' \
+            % (self.origin, self.spacing, self.shape)
+
+    def __eq__(self, other):
+        return (isinstance(other, GridGeometry)
+                and (self.origin, self.spacing, self.shape)
+                == (other.origin, other.spacing, other.shape))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.origin, self.spacing, self.shape))
+
+    def __getstate__(self):
+        return (self.origin, self.spacing, self.shape)
+
+    def __setstate__(self, state):
+        self.origin, self.spacing, self.shape = state
+
+    @property
+    def dx(self):
+        return self.spacing[0]
+
+    @property
+    def dy(self):
+        return self.spacing[1]
+
+    @classmethod
+    def from_coordinates(cls, x, y, shape=None):
+        """
+        Describes the grid of coordinate arrays, scanning them once.
+
+        Arguments:
+            * x, y: 2d-arrays
+                Arrays with the x and y coordinates of the data points.
+            * shape: tuple = (ny, nx)
+                The number of data points in each direction. Defaults to the
+                shape of 'x'.
+
+        Returns:
+            * geometry: GridGeometry
+        """
+
+        shape = np.shape(x) if shape is None else shape
+        x0, x1 = np.amin(x), np.amax(x)
+        y0, y1 = np.amin(y), np.amax(y)
+
+        # calculate the sample spacing in the x and y directions
+        dx = (x1 - x0) / (shape[1] - 1)
+        dy = (y1 - y0) / (shape[0] - 1)
+
+        return cls((x0, y0), (dx, dy), shape)
+
+    def coordinates(self):
+        """
+        Builds the coordinates of every data point.
+
+        Returns:
+            * x, y: 2d-arrays
+                Arrays with the x and y coordinates of the data points.
+        """
+
+        (ny, nx), (x0, y0), (dx, dy) = self.shape, self.origin, self.spacing
+
+        return np.meshgrid(x0 + dx*np.arange(nx), y0 + dy*np.arange(ny))
+
+    def window(self, window):
+        """
+        Describes a window of the grid.
+
+        Arguments:
+            * window: tuple of slices = (rows, columns)
+                The window, with unit steps.
+
+        Returns:
+            * geometry: GridGeometry
+        """
+
+        (y0, y1, _), (x0, x1, _) = [s.indices(n)
+                                    for s, n in zip(window, self.shape)]
+
+        return GridGeometry((self.origin[0] + self.dx*x0,
+                             self.origin[1] + self.dy*y0),
+                            self.spacing, (y1 - y0, x1 - x0))
+
+def as_geometry(x, y=None, shape=None):
+    """
+    Returns 'x' unchanged if it is already a GridGeometry, otherwise describes
+    the grid of the x and y coordinate arrays.
+
+    Arguments:
+        * x: 2d-array or GridGeometry
+            Array with the x coordinates of the data points, or the grid
+            geometry.
+        * y: 2d-array
+            Array with the y coordinates of the data points. Ignored when 'x'
+            is a GridGeometry.
+        * shape: tuple = (ny, nx)
+            The number of data points in each direction. Defaults to the
+            shape of 'x'.
+
+    Returns:
+        * geometry: GridGeometry
+    """
+
+    if isinstance(x, GridGeometry):
+        return x
+    if x is None or y is None:
+        raise ValueError('Expected x and y coordinate arrays or a '
+                         'GridGeometry')
+
+    return GridGeometry.from_coordinates(x, y, shape)
@@ -0,0 +1,281 @@
+"""
+    Grid I/O
+
+    A Python program to read and write gridded potential-field surveys.
+
+    Surveys are distributed as text files of x, y, z, tf columns (data.dat),
+    which are slow to parse and store the coordinates of every node although
+    the grid is regular. They can be converted once into a binary grid file:
+
+        * the magic string MAGIC;
+        * the length of the header, as a little-endian 4-byte integer;
+        * the header, a JSON object with the grid 'shape' (ny, nx), the data
+          'dtype', the 'origin' (x0, y0) and 'spacing' (dx, dy) of the grid
+          and the names of its 'bands', padded with spaces so the data starts
+          on a 64-byte boundary;
+        * the raw data of every band, in C order, with shape (bands, ny, nx).
+
+    As in the filters, x increases along the columns (axis 1) and y along the
+    rows (axis 0). The data is opened with np.memmap, without any parsing,
+    together with its GridGeometry, which builds the coordinates only on
+    request.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import os
+import re
+import json
+import struct
+import numpy as np
+from Filters.geometry import GridGeometry
+
+MAGIC = b'\x93GRID\x01'
+
+# the data of a binary grid starts on a multiple of this number of bytes
+ALIGN = 64
+
+def read_dat(path):
+    """
+    Reads a survey in the x, y, z, tf column format of data.dat. The grid
+    shape is taken from a '# grid shape: (ny, nx)' header line if present,
+    otherwise from the number of distinct coordinates of the first column.
+
+    Arguments:
+        * path: str
+            Path of the file.
+
+    Returns:
+        * x, y, z, tf: 2d-arrays
+            The coordinates, the observation heights and the total-field
+            anomaly of the data points.
+    """
+
+    shape = None
+    with open(path) as fh:
+        for line in fh:
+            if not line.startswith('#'):
+                break
+            match = re.search(r'grid shape:\s*\((\d+),\s*(\d+)\)', line)
+            if match:
+                shape = (int(match.group(1)), int(match.group(2)))
+
+    data = np.loadtxt(path)
+    if shape is None:
+        n = len(np.unique(data[:, 0]))
+        shape = (n, data.shape[0] // n)
+
+    return tuple(np.reshape(data[:, i], shape) for i in range(4))
+
+def axis_spacing(c, tol=1e-3):
+    """
+    Finds the array axis along which a coordinate array increases, and its
+    origin and spacing.
+
+    Arguments:
+        * c: 2d-array
+            Coordinates of the data points, constant along one axis.
+        * tol: float
+            Largest deviation from a regular grid, as a fraction of the
+            spacing. Defaults to 1e-3 (coordinates are often rounded).
+
+    Returns:
+        * axis: int
+            The axis along which the coordinate varies.
+        * origin, spacing: floats
+    """
+
+    for axis in (1, 0):
+        n = c.shape[axis]
+        c0 = np.take(c, 0, axis)
+        c1 = np.take(c, n - 1, axis)
+        if n < 2 or np.any(c0 != c0.flat[0]) or c1.flat[0] == c0.flat[0]:
+            continue
+        origin = float(c0.flat[0])
+        spacing = float(c1.flat[0] - c0.flat[0]) / (n - 1)
+        shape = [1, 1]
+        shape[axis] = n
+        regular = origin + spacing*np.arange(n).reshape(shape)
+        if np.amax(np.abs(c - regular)) <= tol*abs(spacing):
+            return axis, origin, spacing
+
+    raise ValueError('The coordinates do not form a regular grid')
+
+def write_grid(path, data, geometry, bands=None, dtype=None):
+    """
+    Writes a binary grid file (see the module documentation).
+
+    Arguments:
+        * path: str
+            Path of the file.
+        * data: 2d-array or 3d-array
+            The data of one band, or of several bands stacked on the first
+            axis.
+        * geometry: GridGeometry
+            Origin and sample spacing of the grid.
+        * bands: list of str
+            Names of the bands. Defaults to 'data', or 'band0', 'band1', ...
+        * dtype: data type
+            Type of the stored data, e.g. np.float32. Defaults to the type of
+            'data'.
+    """
+
+    data = np.asarray(data, dtype)
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    if bands is None:
+        bands = (['data'] if len(data) == 1
+                 else ['band%d' % i for i in range(len(data))])
+    if len(bands) != len(data):
+        raise ValueError('Expected %d band names, got %d'
+                         % (len(data), len(bands)))
+
+    header = json.dumps({'shape': list(data.shape[1:]),
+                         'dtype': data.dtype.str,
+                         'origin': list(geometry.origin),
+                         'spacing': list(geometry.spacing),
+                         'bands': list(bands)}).encode('utf-8')
+
+    # pad the header so the data is aligned
+    start = len(MAGIC) + 4 + len(header)
+    header += b' ' * (-start % ALIGN)
+
+    with open(path, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack('<I', len(header)))
+        fh.write(header)
+        fh.write(np.ascontiguousarray(data).tobytes())
+
+def read_header(path):
+    """
+    Reads the header of a binary grid file.
+
+    Arguments:
+        * path: str
+            Path of the file.
+
+    Returns:
+        * header: dict
+            The grid 'shape', 'dtype', 'origin', 'spacing' and 'bands', plus
+            the 'offset' of the data in the file.
+    """
+
+    with open(path, 'rb') as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            raise ValueError("'%s' is not a binary grid file" % path)
+        size, = struct.unpack('<I', fh.read(4))
+        header = json.loads(fh.read(size).decode('utf-8'))
+
+    header['shape'] = tuple(header['shape'])
+    header['offset'] = len(MAGIC) + 4 + size
+
+    return header
+
+def read_grid(path, band=None, mode='r'):
+    """
+    Opens the data of a binary grid file as a np.memmap.
+
+    Arguments:
+        * path: str
+            Path of the file.
+        * band: None, str or int
+            Name or index of the band to open. None opens the only band of a
+            single-band grid, or all the bands of a multi-band grid.
+        * mode: str
+            np.memmap mode, 'r' (read-only, the default), 'r+' or 'c'.
+
+    Returns:
+        * data: np.memmap
+            The (ny, nx) data of the band, or the (bands, ny, nx) data of all
+            the bands.
+        * geometry: GridGeometry
+            Origin, sample spacing and shape of the grid.
+    """
+
+    header = read_header(path)
+    geometry = GridGeometry(header['origin'], header['spacing'],
+                            header['shape'])
+    shape = (len(header['bands']),) + header['shape']
+    data = np.memmap(path, header['dtype'], mode, header['offset'], shape)
+
+    if band is None and shape[0] == 1:
+        band = 0
+    if band is None:
+        return data, geometry
+    if isinstance(band, str):
+        if band not in header['bands']:
+            raise ValueError("Unknown band '%s', expected one of %s"
+                             % (band, ', '.join(header['bands'])))
+        band = header['bands'].index(band)
+
+    return data[band], geometry
+
+def convert_dat(src, dst=None, dtype=None):
+    """
+    Converts a survey in the x, y, z, tf column format into a binary grid
+    file with the bands 'z' and 'tf'.
+
+    Each coordinate column is assigned to the grid axis it varies along: in
+    data.dat the x column (northing) varies along the rows, so it becomes the
+    row coordinate, and the y column (easting) the column coordinate.
+
+    Arguments:
+        * src: str
+            Path of the text file.
+        * dst: str
+            Path of the binary file. Defaults to 'src' with the '.grd'
+            extension.
+        * dtype: data type
+            Type of the stored data, e.g. np.float32. Defaults to float64.
+
+    Returns:
+        * dst: str
+            Path of the binary file.
+    """
+
+    if dst is None:
+        dst = os.path.splitext(src)[0] + '.grd'
+
+    x, y, z, tf = read_dat(src)
+    axes = dict((axis, (origin, spacing))
+                for axis, origin, spacing in map(axis_spacing, (x, y)))
+    if sorted(axes) != [0, 1]:
+        raise ValueError("The coordinates of '%s' do not form a regular grid"
+                         % src)
+
+    # axis 1 holds the column (x) coordinate, axis 0 the row (y) coordinate
+    (x0, dx), (y0, dy) = axes[1], axes[0]
+    geometry = GridGeometry((x0, y0), (dx, dy), np.shape(tf))
+    write_grid(dst, [z, tf], geometry, ['z', 'tf'], dtype)
+
+    return dst
+
+def open_grid(path, band='tf', mode='r'):
+    """
+    Opens one band of a survey grid as a np.memmap. A text survey (.dat) is
+    converted to a binary grid beside it on first use, and again whenever it
+    is newer than its conversion.
+
+    Arguments:
+        * path: str
+            Path of a binary grid file, or of a text survey.
+        * band: str or int
+            The band to open. Defaults to 'tf', the total-field anomaly.
+        * mode: str
+            np.memmap mode. Defaults to 'r'.
+
+    Returns:
+        * data: np.memmap
+            The (ny, nx) data of the band.
+        * geometry: GridGeometry
+            Origin, sample spacing and shape of the grid.
+    """
+
+    if path.endswith('.dat'):
+        grd = os.path.splitext(path)[0] + '.grd'
+        if (not os.path.exists(grd)
+                or os.path.getmtime(grd) < os.path.getmtime(path)):
+            convert_dat(path, grd)
+        path = grd
+
+    return read_grid(path, band, mode)
@@ -7,45 +7,117 @@
 """
 
 import numpy as np
-from Filters.fft_processing import *
+from Filters.spectral import SpectralGrid, as_spectral_grid
+from Filters.geometry import as_geometry
 
-def dh(f, x, y):
+# finite-difference stencils: name -> (half width, first-derivative weights,
+# second-derivative weights), the weights running over the offsets
+# -width..width
+STENCILS = {
+    'central2': (1, (-1/2., 0., 1/2.), (1., -2., 1.)),
+    'central4': (2, (1/12., -2/3., 0., 2/3., -1/12.),
+                 (-1/12., 4/3., -5/2., 4/3., -1/12.)),
+    'central6': (3, (-1/60., 3/20., -3/4., 0., 3/4., -3/20., 1/60.),
+                 (1/90., -3/20., 3/2., -49/18., 3/2., -3/20., 1/90.)),
+}
+
+def dh(f, x=None, y=None, dfdx=None, dfdy=None, method='conv',
+       stencil='gradient'):
     """
     Calculates the Total Horizontal Derivative of a 2d-array.
 
         THD = sqrt(dx^2 + dy^2)
 
     Arguments:
-        * f: 2d-array
-            Array with data to calculate derivative on.
-        * x, y: 2d-arrays
-            Array with the x and y coordinates of the data points.
+        * f: 2d-array or SpectralGrid
+            Array with data to calculate derivative on, or its shared spectral
+            context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Array with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * dfdx, dfdy: 2d-arrays
+            Optional first-order partial derivatives in the x and y directions,
+            if already calculated.
+        * method: str
+            'conv' to calculate the partial derivatives with finite
+            differences (see dxdy_conv), or 'fft' in the wavenumber domain
+            (see dxdy_fft). Defaults to 'conv'.
+        * stencil: str
+            Finite-difference stencil of the 'conv' method. Defaults to
+            'gradient'.
 
     Returns:
         * dfdh: 2d-array
             Array containing the total horizontal derivative.
     """
 
-    # calculate the x, y partial derivatives in spatial domain using convolution
-    dfdx, dfdy = dxdy_conv(f, x, y, 1)
+    # calculate the x, y partial derivatives, unless given
+    if dfdx is None or dfdy is None:
+        dfdx, dfdy = dxdy(f, x, y, 1, method, stencil)
 
     # calculate total horizontal derivative
     dfdh = (dfdx**2 + dfdy**2)**0.5
 
     return dfdh
 
-def dxdy_conv(f, x, y, n=1):
+def dxdy(f, x=None, y=None, n=1, method='conv', stencil='gradient'):
+    """
+    Calculates the n-th partial derivatives of a 2d-array in the x and y
+    directions with the given method.
+
+    Arguments:
+        * f: 2d-array or SpectralGrid
+            Array with data to calculate derivatives on, or its shared spectral
+            context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Array with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * n: int or float
+            Order of the derivatives. Must be an integer for the 'conv'
+            method.
+        * method: str
+            'conv' for finite differences (see dxdy_conv), or 'fft' for the
+            wavenumber domain (see dxdy_fft). Defaults to 'conv'.
+        * stencil: str
+            Finite-difference stencil of the 'conv' method. Defaults to
+            'gradient'.
+
+    Returns:
+        * dfdx, dfdy: 2d-arrays
+    """
+
+    if method == 'conv':
+        return dxdy_conv(f, x, y, n, stencil)
+    if method == 'fft':
+        return dxdy_fft(f, x, y, n)
+
+    raise ValueError("Unknown method '%s', expected 'conv' or 'fft'"
+                     % method)
+
+def dxdy_conv(f, x=None, y=None, n=1, stencil='gradient'):
     """
     Calculates the n-th partial derivative of a 2d-array in the x and y
-    directions.
+    directions using finite differences.
+
+    With the 'gradient' stencil, np.gradient (second-order central
+    differences, first-order at the edges) is applied n times along each
+    axis. The 'central2', 'central4' and 'central6' stencils (see STENCILS)
+    apply central differences of that order of accuracy, a second-derivative
+    stencil for every pair of orders, to the data extended by odd reflection
+    so linear trends continue through the edges. Both directions are taken
+    from the same extended array.
 
     Arguments:
-        * f: 2d-array
-            Array with data to calculate derivatives on.
-        * x, y: 2d-arrays
-            Array with the x and y coordinates of the data points.
+        * f: 2d-array or SpectralGrid
+            Array with data to calculate derivatives on, or its shared spectral
+            context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Array with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
         * n: int
             Order of the derivative to be taken.
+        * stencil: str
+            'gradient' (the default), 'central2', 'central4' or 'central6'.
 
     Returns:
         * dfdx, dfdy: 2d-arrays
@@ -53,31 +125,108 @@ def dxdy_conv(f, x, y, n=1):
             directions respectively.
     """
 
-    # calculate the sample spacing in the x and y directions
-    dx = (np.amax(x) - np.amin(x)) / (f.shape[1] - 1)
-    dy = (np.amax(y) - np.amin(y)) / (f.shape[0] - 1)
+    if isinstance(f, SpectralGrid):
+        # reuse the sample spacing of the spectral context
+        dx, dy = f.dx, f.dy
+        f = f.data
+    else:
+        # the sample spacing in the x and y directions
+        dx, dy = as_geometry(x, y, np.shape(f)[-2:]).spacing
+
+    if stencil == 'gradient':
+        # perform n convolutions along each axis yielding the n-th partial
+        # derivatives (x along the columns, y along the rows)
+        dfdx = f
+        dfdy = f
+        for i in range(1, n+1):
+            dfdx = np.gradient(dfdx, dx, axis=-1)
+            dfdy = np.gradient(dfdy, dy, axis=-2)
+        return dfdx, dfdy
+
+    if stencil not in STENCILS:
+        raise ValueError("Unknown stencil '%s', expected one of gradient, %s"
+                         % (stencil, ', '.join(sorted(STENCILS))))
 
-    # initialize partial derivatives to the data
     dfdx = f
     dfdy = f
+    for order in [2] * (n // 2) + [1] * (n % 2):
+        dfdx, dfdy = stencil_pass(dfdx, dfdy, dx, dy, order, stencil)
+
+    return dfdx, dfdy
+
+def stencil_pass(fx, fy, dx, dy, order, stencil):
+    """
+    Applies a first- or second-derivative stencil (see STENCILS) along the
+    columns (last axis) of 'fx' and the rows of 'fy'. When both are the same
+    array, it is extended once for both directions.
+
+    Returns:
+        * dfdx, dfdy: 2d-arrays
+    """
+
+    width, first, second = STENCILS[stencil]
+    weights = first if order == 1 else second
+
+    def extend(a, axes):
+        pad = [(width, width) if axis in axes else (0, 0)
+               for axis in range(-np.ndim(a), 0)]
+        return np.pad(a, pad, mode='reflect', reflect_type='odd')
 
-    # perform n convolutions yielding the n-th partial derivatives
-    for i in range(1, n+1):
-        dfdy, _ = np.gradient(dfdy, dx, dy)
-        _, dfdx = np.gradient(dfdx, dx, dy)
+    if fx is fy:
+        ex = ey = extend(fx, (-2, -1))
+        rows, cols = slice(width, -width), slice(width, -width)
+    else:
+        ex, ey = extend(fx, (-1,)), extend(fy, (-2,))
+        rows, cols = slice(None), slice(None)
+
+    ny, nx = np.shape(fx)[-2:]
+    dfdx = np.zeros(np.shape(fx), np.result_type(fx, np.float32))
+    dfdy = np.zeros(np.shape(fy), np.result_type(fy, np.float32))
+    for k, w in enumerate(weights):
+        if w:
+            dfdx += w * ex[..., rows, k:k + nx]
+            dfdy += w * ey[..., k:k + ny, cols]
+    dfdx /= dx**order
+    dfdy /= dy**order
 
     return dfdx, dfdy
 
-def dy_fft(f, x, y, n=1):
+def dxdy_fft(f, x=None, y=None, n=1):
+    """
+    Calculates the n-th partial derivatives of a 2d-array in the x and y
+    directions in the wavenumber domain, sharing one forward transform.
+
+    Arguments:
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * n: float
+            Order of the derivatives. Must be positive, may be non-integer
+            for fractional derivatives.
+
+    Returns:
+        * dfdx, dfdy: 2d-arrays
+            Arrays with the n-th partial derivatives of data 'f' in the x and y
+            directions respectively.
+    """
+
+    grid = as_spectral_grid(f, x, y)
+
+    return grid.inverse(dx_kernel(grid, n)), grid.inverse(dy_kernel(grid, n))
+
+def dy_fft(f, x=None, y=None, n=1):
     """
     Calculate the n-th partial derivative of 'f' in the y-direction using the
     FFT method (calculated in the wavenumber domain).
 
     Arguments:
-        * f: 2d-array
-            Array with the gridded data.
-        * x, y: 2d-arrays
-            Arrays with the x and y coordinates of the data points.
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
         * n: float
             Order of the derivative to be taken.
             Must be positive number, may be non-integer for fractional
@@ -88,28 +237,27 @@ def dy_fft(f, x, y, n=1):
             Array of the n-th partial derivative of the data in the y direction.
     """
 
-    # calculate the Fourier Transform of data and associated wavenumbers
-    F, mask = fft_pad_data(f)
-    u, v = fft_wavenumbers(x, y, F.shape, mask.shape)
-
-    # calculate the derivative in the wavenumber domain
-    Fdfdy = ((1j * v) ** n) * F
+    # calculate the Fourier Transform of data and associated wavenumbers,
+    # unless a shared spectral context was given
+    grid = as_spectral_grid(f, x, y)
 
-    # apply the Inverse Fourier Transform to get derivative in spatial domain
-    dfdy = ifft_unpad_data(Fdfdy, mask, f.shape, mask.shape)
+    # calculate the derivative in the wavenumber domain and apply the Inverse
+    # Fourier Transform to get derivative in spatial domain
+    dfdy = grid.inverse(dy_kernel(grid, n))
 
     return dfdy
 
-def dx_fft(f, x, y, n=1):
+def dx_fft(f, x=None, y=None, n=1):
     """
     Calculate the n-th partial derivative of 'f' in the x-direction using the
     FFT method (calculated in the wavenumber domain).
 
     Arguments:
-        * f: 2d-array
-            Array with the gridded data.
-        * x, y: 2d-arrays
-            Arrays with the x and y coordinates of the data points.
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
         * n: float
             Order of the derivative to be taken.
             Must be positive number, may be non-integer for fractional
@@ -120,14 +268,30 @@ def dx_fft(f, x, y, n=1):
             Array of the n-th partial derivative of the data in the x direction.
     """
 
-    # calculate the Fourier Transform of the data and the wavenumbers
-    F, mask = fft_pad_data(f)
-    u, v = fft_wavenumbers(x, y, f.shape, mask.shape)
+    # calculate the Fourier Transform of the data and the wavenumbers, unless
+    # a shared spectral context was given
+    grid = as_spectral_grid(f, x, y)
 
-    # calculate the derivative in the wavenumber domain
-    Fdfdx = ((1j * u) ** n) * F
-
-    # apply the Inverse Fourier Transform to get derivative in spatial domain
-    dfdx = ifft_unpad_data(Fdfdx, mask, f.shape, mask.shape)
+    # calculate the derivative in the wavenumber domain and apply the Inverse
+    # Fourier Transform to get derivative in spatial domain
+    dfdx = grid.inverse(dx_kernel(grid, n))
 
     return dfdx
+
+def dy_kernel(grid, n=1):
+    """
+    Returns the wavenumber-domain filter of the n-th derivative in the
+    y-direction, (2*pi*i*v)^n, of a SpectralGrid (from its kernel cache). The
+    wavenumbers are in cycles per unit length, hence the 2*pi.
+    """
+
+    return grid.kernel('dy', lambda: (2j * np.pi * grid.v) ** n, n)
+
+def dx_kernel(grid, n=1):
+    """
+    Returns the wavenumber-domain filter of the n-th derivative in the
+    x-direction, (2*pi*i*u)^n, of a SpectralGrid (from its kernel cache). The
+    wavenumbers are in cycles per unit length, hence the 2*pi.
+    """
+
+    return grid.kernel('dx', lambda: (2j * np.pi * grid.u) ** n, n)
@@ -0,0 +1,617 @@
+"""
+    Lazy
+
+    A Python program to write filters as expressions over a grid, e.g.
+
+        f = source(tf, geometry)
+        theta = np.arctan(dz(f) / dh(f))
+        hta = np.real(np.arctanh(dz(f) / (dh(f) + 0.25)))
+        theta, hta = compute(theta, hta)
+
+    Nothing is calculated until compute (or Expr.compute). The requested
+    expressions are then evaluated together as one graph:
+
+        * identical subexpressions, e.g. dz(f) above, are calculated once;
+        * every wavenumber-domain operator of a grid shares one forward
+          transform (a SpectralGrid), and linear combinations of them, e.g.
+          dx(f) + 2*dz(f), are applied as a single filter with a single
+          inverse transform;
+        * chains of elementwise operations are fused and evaluated by blocks
+          of rows, so their intermediates stay in cache instead of being
+          full-size temporaries.
+
+    Numpy ufuncs (np.arctan, np.sqrt, ...) and the arithmetic operators build
+    expressions, so the existing filters given lazy derivatives, e.g.
+    tilt.tilt(None, dfdh=dh(f), dfdz=dz(f)), and custom filters written the
+    same way get the same treatment. Registered filters (see registry) join
+    the graph through 'apply'.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import numbers
+import numpy as np
+from Filters.spectral import SpectralGrid
+from Filters.geometry import as_geometry
+from Filters.fft_processing import float_type
+from Filters.horizontal import dxdy_conv, dx_kernel, dy_kernel
+from Filters.vertical import dz_kernel
+from Filters import horizontal, total
+from Filters import tilt as tilts
+from Filters.registry import get_filter, run_filter
+
+# wavenumber-domain operators that can be combined into a single filter
+KERNELS = {'dz': dz_kernel, 'dx': dx_kernel, 'dy': dy_kernel}
+
+# elementwise chains are evaluated by blocks of rows of about this many bytes
+BLOCK_BYTES = 2**18
+
+class Expr(object):
+    """
+    A node of a lazy filter expression. Expressions are built by the
+    functions of this module, the arithmetic operators and numpy ufuncs, and
+    calculated by compute.
+
+    Attributes:
+        * op: str
+            The operation: 'source', 'const', 'spectrum', 'spectral',
+            'gradient', 'filter', 'item', 'ufunc' or 'real'.
+        * args: tuple of Expr
+            The operands.
+        * params: tuple
+            Parameters of the operation.
+        * source: Expr
+            The source grid the expression is calculated from (None for
+            constants).
+    """
+
+    def __init__(self, op, args=(), params=(), source=None):
+
+        self.op = op
+        self.args = tuple(args)
+        self.params = params
+        if source is None:
+            sources = [arg.source for arg in self.args
+                       if arg.source is not None]
+            source = sources[0] if sources else None
+        self.source = source
+
+    def __repr__(self):
+        return 'Expr(%r, %d args)' % (self.op, len(self.args))
+
+    def compute(self):
+        """
+        Calculates the expression (see compute).
+        """
+
+        return compute(self)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or ufunc.nout != 1 or kwargs:
+            return NotImplemented
+
+        return Expr('ufunc', [as_expr(a) for a in inputs], (ufunc,))
+
+    def _binary(ufunc, reflected=False):
+        if reflected:
+            return lambda self, other: ufunc(as_expr(other), self)
+        return lambda self, other: ufunc(self, as_expr(other))
+
+    __add__, __radd__ = _binary(np.add), _binary(np.add, True)
+    __sub__, __rsub__ = _binary(np.subtract), _binary(np.subtract, True)
+    __mul__, __rmul__ = _binary(np.multiply), _binary(np.multiply, True)
+    __truediv__ = _binary(np.true_divide)
+    __rtruediv__ = _binary(np.true_divide, True)
+    __pow__, __rpow__ = _binary(np.power), _binary(np.power, True)
+    del _binary
+
+    def __neg__(self):
+        return np.negative(self)
+
+    def __abs__(self):
+        return np.absolute(self)
+
+    @property
+    def real(self):
+        return Expr('real', [self])
+
+def as_expr(a):
+    """
+    Returns 'a' unchanged if it is an expression, otherwise a constant
+    expression holding it (a scalar, or an array with the grid shape).
+    """
+
+    if isinstance(a, Expr):
+        return a
+
+    return Expr('const', params=(a,))
+
+def source(f, x=None, y=None, **options):
+    """
+    Starts a lazy expression from gridded data.
+
+    Arguments:
+        * f: 2d-array or SpectralGrid
+            Array with the data, or its spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * options: keyword arguments
+            Options of the shared SpectralGrid, e.g. n_pts=20 or
+            dtype=np.float32 (see spectral.SpectralGrid).
+
+    Returns:
+        * f: Expr
+    """
+
+    if isinstance(f, SpectralGrid):
+        geometry = f.geometry
+    else:
+        geometry = as_geometry(x, y, np.shape(f)[-2:])
+    node = Expr('source', params=(f, geometry, options))
+    node.source = node
+
+    return node
+
+def spectrum(f):
+    """
+    The shared SpectralGrid of an expression.
+    """
+
+    return Expr('spectrum', [f])
+
+def dz(f, n=1):
+    """
+    Lazy n-th vertical derivative of an expression (see vertical.dz: the
+    second derivative is calculated with Laplace's equation in the spatial
+    domain, any other order in the wavenumber domain).
+    """
+
+    if n == 2:
+        dfdx, dfdy = dxdy(f, 2)
+        return -(dfdx + dfdy)
+
+    return Expr('spectral', [spectrum(f)], ((1, 'dz', n),))
+
+def dx(f, n=1):
+    """
+    Lazy n-th derivative of an expression in the x-direction, in the
+    wavenumber domain (see horizontal.dx_fft).
+    """
+
+    return Expr('spectral', [spectrum(f)], ((1, 'dx', n),))
+
+def dy(f, n=1):
+    """
+    Lazy n-th derivative of an expression in the y-direction, in the
+    wavenumber domain (see horizontal.dy_fft).
+    """
+
+    return Expr('spectral', [spectrum(f)], ((1, 'dy', n),))
+
+def dxdy(f, n=1):
+    """
+    Lazy n-th derivatives of an expression in the x and y directions, by
+    convolution (see horizontal.dxdy_conv).
+
+    Returns:
+        * dfdx, dfdy: Expr
+    """
+
+    grad = Expr('gradient', [f], (n,))
+
+    return Expr('item', [grad], (0,)), Expr('item', [grad], (1,))
+
+def dh(f):
+    """
+    Lazy total horizontal derivative of an expression (see horizontal.dh).
+    """
+
+    dfdx, dfdy = dxdy(f)
+
+    return horizontal.dh(None, dfdx=dfdx, dfdy=dfdy)
+
+def dt(f):
+    """
+    Lazy total derivative of an expression (see total.dt).
+    """
+
+    dfdx, dfdy = dxdy(f)
+
+    return total.dt(None, dfdx=dfdx, dfdy=dfdy, dfdz=dz(f))
+
+def tilt(f):
+    """
+    Lazy tilt angle of an expression (see tilt.tilt).
+    """
+
+    return tilts.tilt(None, dfdh=dh(f), dfdz=dz(f))
+
+def hyperbolic_tilt(f, k=0.25):
+    """
+    Lazy hyperbolic tilt angle of an expression (see tilt.hyperbolic_tilt).
+    """
+
+    return tilts.hyperbolic_tilt(None, k=k, dfdh=dh(f), dfdz=dz(f))
+
+def apply(name, f, **params):
+    """
+    Lazy registered filter (see registry), run on the shared SpectralGrid of
+    an expression.
+
+    Arguments:
+        * name: str or callable
+            Name of a registered filter, or a filter function accepting a
+            SpectralGrid.
+        * f: Expr
+            The data.
+        * params: keyword arguments
+            Parameters of the filter.
+
+    Returns:
+        * result: Expr, or tuple of Expr for filters with several outputs.
+    """
+
+    _, outputs = get_filter(name)
+    node = Expr('filter', [spectrum(f)],
+                (name, tuple(sorted(params.items()))))
+    if len(outputs) == 1:
+        return Expr('item', [node], (0,))
+
+    return tuple(Expr('item', [node], (i,)) for i in range(len(outputs)))
+
+def hashable(value):
+    """
+    Returns a value usable in a dictionary key: the value itself if it is
+    hashable and not an array, otherwise its identity.
+    """
+
+    if isinstance(value, np.ndarray):
+        return ('id', id(value))
+    if isinstance(value, tuple):
+        return tuple(hashable(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return ('id', id(value))
+
+    return value
+
+def is_scalar(node):
+    """
+    Whether an expression is a constant real or complex number.
+    """
+
+    return node.op == 'const' and isinstance(node.params[0], numbers.Number)
+
+def linear_terms(node, consumers):
+    """
+    Writes a node as one filter of a shared spectrum when it is a linear
+    combination of wavenumber-domain operators used nowhere else, e.g.
+    dx(f) + 2*dz(f).
+
+    Returns:
+        * spectrum, terms: Expr and tuple of (coefficient, kernel, order), or
+            None if the node is not such a combination.
+    """
+
+    if node.op != 'ufunc':
+        return None
+
+    ufunc = node.params[0]
+    args = node.args
+    spectral = [a for a in args
+                if a.op == 'spectral' and consumers.get(a, 0) == 1]
+
+    if ufunc in (np.add, np.subtract) and len(spectral) == 2 \
+            and args[0].args[0] is args[1].args[0]:
+        sign = -1 if ufunc is np.subtract else 1
+        terms = args[0].params + tuple((sign*c, kind, n)
+                                       for c, kind, n in args[1].params)
+    elif ufunc is np.negative and len(spectral) == 1:
+        terms = tuple((-c, kind, n) for c, kind, n in args[0].params)
+    elif ufunc is np.multiply and len(spectral) == 1 \
+            and any(is_scalar(a) for a in args):
+        c = [a for a in args if is_scalar(a)][0].params[0]
+        terms = tuple((c*t, kind, n) for t, kind, n in spectral[0].params)
+    else:
+        return None
+
+    # merge repeated kernels
+    merged = {}
+    for c, kind, n in terms:
+        merged[(kind, n)] = merged.get((kind, n), 0) + c
+    terms = tuple((c, kind, n) for (kind, n), c in sorted(merged.items()))
+
+    return spectral[0].args[0], terms
+
+def rebuild(exprs, rewrite=None):
+    """
+    Rebuilds the graph of a set of expressions from unique nodes, optionally
+    rewriting each node once its operands are rebuilt.
+
+    Arguments:
+        * exprs: list of Expr
+        * rewrite: callable
+            Called as rewrite(node, original) with a rebuilt node and the
+            mapping of the rebuilt nodes to the nodes they replace. Returns a
+            replacement node or None.
+
+    Returns:
+        * exprs: list of Expr
+            The rebuilt expressions.
+        * order: list of Expr
+            Every node, each listed after its operands.
+        * uses: dict
+            Number of uses of every node, as an operand or as an expression.
+    """
+
+    canon = {}
+    original = {}
+    order = []
+
+    def key(node):
+        if node.op == 'source':
+            return ('source', id(node))
+        if node.op == 'const':
+            return ('const', hashable((type(node.params[0]),
+                                       node.params[0])))
+        return (node.op, hashable(node.params)) + tuple(map(id, node.args))
+
+    def visit(node):
+        if node in visited:
+            return visited[node]
+
+        args = [visit(arg) for arg in node.args]
+        new = node if args == list(node.args) else \
+            Expr(node.op, args, node.params, node.source)
+        original[new] = node
+        if rewrite is not None:
+            replaced = rewrite(new, original)
+            if replaced is not None:
+                original[replaced] = node
+                new = replaced
+        k = key(new)
+        if k not in canon:
+            canon[k] = new
+            order.append(new)
+        visited[node] = canon[k]
+
+        return canon[k]
+
+    visited = {}
+    exprs = [visit(e) for e in exprs]
+
+    # count the uses of the nodes still reachable from the expressions
+    uses = {}
+    stack = list(exprs)
+    while stack:
+        node = stack.pop()
+        uses[node] = uses.get(node, 0) + 1
+        if uses[node] == 1:
+            stack.extend(node.args)
+    order = [node for node in order if node in uses]
+
+    return exprs, order, uses
+
+def optimize(exprs):
+    """
+    Deduplicates the graph of a set of expressions and merges the linear
+    combinations of wavenumber-domain operators (see linear_terms).
+
+    Arguments:
+        * exprs: list of Expr
+
+    Returns:
+        * exprs: list of Expr
+            The same expressions, rebuilt from unique nodes.
+        * order: list of Expr
+            Every node, each listed after its operands.
+    """
+
+    exprs, _, uses = rebuild(exprs)
+
+    def merge(node, original):
+        # operators are only merged if the combination is their only use in
+        # the deduplicated graph, so every merge saves an inverse transform
+        counts = dict((arg, uses.get(original.get(arg, arg), 0))
+                      for arg in node.args)
+        found = linear_terms(node, counts)
+        if found is None:
+            return None
+
+        grid, terms = found
+        return Expr('spectral', [grid], terms, node.source)
+
+    exprs, order, _ = rebuild(exprs, merge)
+
+    return exprs, order
+
+def evaluate(node, args):
+    """
+    Calculates a node that is not elementwise from the values of its operands.
+    """
+
+    op = node.op
+    if op == 'source':
+        f, geometry, options = node.params
+        if isinstance(f, SpectralGrid):
+            return f.data
+        return np.asarray(f, float_type(f, options.get('dtype')))
+    if op == 'const':
+        return node.params[0]
+    if op == 'spectrum':
+        f, geometry, options = node.source.params
+        if isinstance(f, SpectralGrid):
+            if node.args[0] is node.source:
+                return f
+            options = dict(n_pts=f.n_pts, mode=f.mode, real=f.real,
+                           backend=f.backend, fast_len=f.fast_len,
+                           dtype=f.dtype)
+        return SpectralGrid(args[0], geometry, **options)
+    if op == 'spectral':
+        grid = args[0]
+        terms = node.params
+        if len(terms) == 1 and terms[0][0] == 1:
+            K = KERNELS[terms[0][1]](grid, terms[0][2])
+        else:
+            K = sum(c * KERNELS[kind](grid, n) for c, kind, n in terms)
+        return grid.inverse(K)
+    if op == 'gradient':
+        return dxdy_conv(args[0], node.source.params[1], None, node.params[0])
+    if op == 'filter':
+        name, params = node.params
+        return run_filter(name, args[0], **dict(params))
+    if op == 'item':
+        return args[0][node.params[0]]
+
+    raise ValueError("Unknown operation '%s'" % op)
+
+def elementwise(node):
+    return node.op in ('ufunc', 'real')
+
+def apply_ufunc(ufunc, values, owned):
+    """
+    Applies a ufunc, writing into an operand buffer no longer needed when the
+    result has the same shape and type.
+    """
+
+    # powers use the same fast paths as the ** operator of numpy arrays
+    if ufunc is np.power and np.ndim(values[1]) == 0 and \
+            not isinstance(values[1], np.ndarray):
+        fast = {2: np.square, 0.5: np.sqrt, 1: np.positive,
+                -1: np.reciprocal}.get(values[1])
+        if fast is not None:
+            ufunc, values, owned = fast, values[:1], owned[:1]
+
+    shape = np.broadcast_shapes(*[np.shape(v) for v in values])
+    for value, own in zip(values, owned):
+        if own and np.shape(value) == shape:
+            try:
+                return ufunc(*values, out=value, casting='no'), True
+            except TypeError:
+                pass
+
+    return ufunc(*values), True
+
+def fused(root, values, inline):
+    """
+    Calculates a chain of elementwise operations by blocks of rows.
+
+    Arguments:
+        * root: Expr
+            The last operation of the chain.
+        * values: dict
+            Values of the operands calculated so far.
+        * inline: set
+            Elementwise nodes calculated within the chain.
+
+    Returns:
+        * result: array
+    """
+
+    leaves = []
+
+    def collect(node):
+        if node in inline or node is root:
+            for arg in node.args:
+                collect(arg)
+        else:
+            leaves.append(values[node])
+
+    collect(root)
+    shape = np.broadcast_shapes(*[np.shape(v) for v in leaves])
+    if len(shape) < 2:
+        return block(root, values, inline, Ellipsis, len(shape))[0]
+
+    width = int(np.prod(shape[1:])) * 8
+    rows = max(1, BLOCK_BYTES // width)
+    result = None
+    for start in range(0, shape[0], rows):
+        rows_slice = slice(start, min(start + rows, shape[0]))
+        part = block(root, values, inline, rows_slice, len(shape))[0]
+        if result is None:
+            result = np.empty(shape, np.asarray(part).dtype)
+        result[rows_slice] = part
+
+    return result
+
+def block(node, values, inline, rows, ndim):
+    """
+    Calculates an elementwise chain on a block of rows, the slice 'rows' of
+    the first axis of a result with 'ndim' dimensions. Values with fewer
+    dimensions, e.g. a 2d grid combined with a stack, broadcast whole.
+
+    Returns:
+        * value: array or scalar
+        * owned: bool
+            Whether the value is a temporary that may be overwritten.
+    """
+
+    if node in values:
+        value = values[node]
+        if np.ndim(value) == ndim and np.shape(value)[0] > 1:
+            value = value[rows]
+        return value, False
+
+    results = [block(arg, values, inline, rows, ndim) for arg in node.args]
+    if node.op == 'real':
+        value, own = results[0]
+        if np.iscomplexobj(value):
+            return np.real(value), False
+        return value, own
+
+    return apply_ufunc(node.params[0], [v for v, _ in results],
+                       [o for _, o in results])
+
+def compute(*exprs):
+    """
+    Calculates lazy expressions together (see the module documentation).
+
+    Arguments:
+        * exprs: Expr
+            The expressions.
+
+    Returns:
+        * result: 2d-array, or tuple of 2d-arrays for several expressions.
+    """
+
+    exprs, order = optimize([as_expr(e) for e in exprs])
+    outputs = set(exprs)
+
+    # elementwise nodes with a single elementwise consumer are calculated
+    # within the chain of that consumer, the others are materialized
+    consumers = {}
+    for node in order:
+        for arg in node.args:
+            consumers.setdefault(arg, []).append(node)
+    inline = set(node for node in order
+                 if elementwise(node) and node not in outputs
+                 and len(consumers.get(node, [])) == 1
+                 and elementwise(consumers[node][0]))
+
+    remaining = dict((node, len(users)) for node, users in consumers.items())
+    values = {}
+    for node in order:
+        if node in inline:
+            continue
+        if elementwise(node):
+            values[node] = fused(node, values, inline)
+        else:
+            values[node] = evaluate(node, [values.get(arg)
+                                           for arg in node.args])
+
+        # release intermediates after their last use
+        stack = list(node.args)
+        while stack:
+            arg = stack.pop()
+            if arg in inline:
+                stack.extend(arg.args)
+                continue
+            remaining[arg] -= 1
+            if remaining[arg] == 0 and arg not in outputs:
+                values.pop(arg, None)
+
+    results = tuple(values[e] for e in exprs)
+
+    return results[0] if len(results) == 1 else results
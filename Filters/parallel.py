@@ -0,0 +1,263 @@
+"""
+    Parallel
+
+    A Python program to run filters in a pool of processes, either over the
+    tiles of one large grid or over many survey grids at once.
+
+    Tiles are never pickled: the input and output grids live in shared memory
+    (or in the memory-mapped files they came from) and each worker reads its
+    window and writes its tile in place. Only the grid geometry is sent along,
+    never coordinate arrays.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import os
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from Filters.registry import get_filter, run_filter, filter_label, \
+    filter_specs
+from Filters.tiling import tile_windows, output_paths
+from Filters.spectral import SpectralGrid
+from Filters.geometry import as_geometry
+from Filters import gridio
+
+def share(a, blocks):
+    """
+    Describes an array so that a worker process can attach to it without
+    copying: memory-mapped files are described by their path, anything else
+    is copied once into a new shared memory block.
+
+    Arguments:
+        * a: array
+            The array to share.
+        * blocks: list
+            Shared memory blocks created so far, to release when done.
+
+    Returns:
+        * spec: tuple
+            Description of the array, see attach.
+    """
+
+    if isinstance(a, np.memmap) and isinstance(a.base, mmap.mmap):
+        return ('memmap', a.filename, a.offset, a.shape, a.dtype.str,
+                a.flags.f_contiguous)
+
+    a = np.ascontiguousarray(a)
+    shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+    blocks.append(shm)
+    np.ndarray(a.shape, a.dtype, buffer=shm.buf)[...] = a
+
+    return ('shm', shm.name, 0, a.shape, a.dtype.str, False)
+
+def attach(spec, handles):
+    """
+    Attaches to an array described by share.
+
+    Arguments:
+        * spec: tuple
+            Description of the array.
+        * handles: list
+            Shared memory handles opened so far, to close when done.
+
+    Returns:
+        * a: array
+    """
+
+    kind, name, offset, shape, dtype, fortran = spec
+    order = 'F' if fortran else 'C'
+    if kind == 'memmap':
+        return np.memmap(name, dtype, 'r+', offset, shape, order)
+
+    shm = shared_memory.SharedMemory(name=name)
+    handles.append(shm)
+
+    return np.ndarray(shape, dtype, buffer=shm.buf, order=order)
+
+def run_tile(name, params, in_spec, out_specs, geometry, window, core, inner):
+    """
+    Worker task: runs a filter on one window and writes its tile.
+    """
+
+    handles = []
+    try:
+        f = attach(in_spec, handles)
+        results = run_filter(name, np.array(f[window]),
+                             geometry.window(window), **params)
+        for i in range(len(out_specs)):
+            attach(out_specs[i], handles)[core] = results[i][inner]
+    finally:
+        f = None
+        for shm in handles:
+            shm.close()
+
+def parallel_tiled(name, f, x, y=None, tile_shape=(1024, 1024), overlap=64,
+                   workers=None, out=None, **params):
+    """
+    Runs a registered filter over a grid tile by tile in a pool of processes.
+    The results are the same as tiling.apply_tiled (see it for the error
+    bound against the whole-grid result).
+
+    Arguments:
+        * name: str
+            Name of a registered filter (see registry).
+        * f: 2d-array
+            Array with the data, usually a np.memmap.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points.
+        * tile_shape: tuple = (ty, tx)
+            Number of output points of a tile in each direction. Defaults to
+            (1024, 1024).
+        * overlap: int
+            Number of context points on each side of a tile. Defaults to 64.
+        * workers: int
+            Number of processes. Defaults to the number of CPUs.
+        * out: None or str
+            None for in-memory results, or a .npy path for memory-mapped
+            results (see tiling.output_paths).
+        * params: keyword arguments
+            Parameters of the filter, e.g. n=1.5 for 'dz'.
+
+    Returns:
+        * result: 2d-array, or tuple of 2d-arrays for filters with several
+            outputs.
+    """
+
+    _, outputs = get_filter(name)
+    shape = np.shape(f)
+    geometry = as_geometry(x, y, shape)
+    windows = tile_windows(shape, tile_shape, overlap)
+    blocks = []
+
+    try:
+        # the first tile runs here and fixes the type of the outputs
+        window, core, inner = windows[0]
+        first = run_filter(name, np.array(f[window]), geometry.window(window),
+                           **params)
+        dtype = first[0].dtype
+
+        if out is None:
+            size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+            out_specs = []
+            for _ in outputs:
+                shm = shared_memory.SharedMemory(create=True, size=size)
+                blocks.append(shm)
+                out_specs.append(('shm', shm.name, 0, shape, dtype.str, False))
+            arrays = [np.ndarray(shape, dtype, buffer=shm.buf)
+                      for shm in blocks]
+        else:
+            arrays = [np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                                shape=shape)
+                      for path in output_paths(out, outputs)]
+            out_specs = [share(array, blocks) for array in arrays]
+
+        for i in range(len(arrays)):
+            arrays[i][core] = first[i][inner]
+        first = None
+
+        in_spec = share(f, blocks)
+
+        with ProcessPoolExecutor(workers) as pool:
+            tasks = [pool.submit(run_tile, name, params, in_spec, out_specs,
+                                 geometry, window, core, inner)
+                     for window, core, inner in windows[1:]]
+            for task in tasks:
+                task.result()
+
+        if out is None:
+            # copy the results out of shared memory before releasing it
+            arrays = [np.array(a) for a in arrays]
+        else:
+            for a in arrays:
+                a.flush()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    return arrays[0] if len(arrays) == 1 else tuple(arrays)
+
+def run_survey(path, filters, out_dir):
+    """
+    Worker task: runs a suite of filters on one survey grid, sharing a single
+    forward transform, and saves every output to 'out_dir' as
+    '<survey>_<filter label>[_<output>].npy'.
+
+    Arguments:
+        * path: str
+            Path of the survey, a binary grid or a text survey (see
+            gridio.open_grid).
+        * filters: list
+            Filter names, or (name, params) pairs.
+        * out_dir: str
+            Output directory.
+
+    Returns:
+        * paths: list of str
+            Paths of the saved outputs.
+    """
+
+    tf, geometry = gridio.open_grid(path)
+    grid = SpectralGrid(tf, geometry)
+    survey = os.path.splitext(os.path.basename(path))[0]
+
+    paths = []
+    for name, params in filter_specs(filters):
+        _, outputs = get_filter(name)
+        results = run_filter(name, grid, **params)
+        label = os.path.join(out_dir, '%s_%s.npy'
+                             % (survey, filter_label(name, params)))
+        for path, result in zip(output_paths(label, outputs), results):
+            np.save(path, result)
+            paths.append(path)
+
+    return paths
+
+def run_batch(paths, filters, out_dir, workers=None):
+    """
+    Runs a suite of filters over many survey grids concurrently, one survey
+    per process. The outputs are named after the survey file names (see
+    run_survey), which must therefore differ: surveys such as 'a/data.dat'
+    and 'b/data.dat' are refused rather than overwriting each other.
+
+    Arguments:
+        * paths: str or list of str
+            Survey files, or a directory whose surveys are all processed: its
+            '.dat' text surveys and its '.grd' binary grids that are not
+            conversions of one of them.
+        * filters: list
+            Filter names (see registry), or (name, params) pairs, e.g.
+            ['dz', ('dz', {'n': 1.5}), 'tilt', ('pss', {'hc': 500})].
+        * out_dir: str
+            Output directory, created if needed.
+        * workers: int
+            Number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        * outputs: dict
+            The saved output paths of each survey.
+    """
+
+    if isinstance(paths, str):
+        names = os.listdir(paths)
+        paths = sorted(os.path.join(paths, name) for name in names
+                       if name.endswith('.dat') or (name.endswith('.grd')
+                       and name[:-4] + '.dat' not in names))
+
+    surveys = {}
+    for path in paths:
+        survey = os.path.splitext(os.path.basename(path))[0]
+        if survey in surveys:
+            raise ValueError("The surveys '%s' and '%s' would write the same "
+                             "outputs" % (surveys[survey], path))
+        surveys[survey] = path
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    with ProcessPoolExecutor(workers) as pool:
+        tasks = dict((path, pool.submit(run_survey, path, filters, out_dir))
+                     for path in paths)
+
+        return dict((path, task.result()) for path, task in tasks.items())
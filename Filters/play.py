@@ -1,10 +1,19 @@
-import numpy as np
+import os
+import sys
+import functools
 import matplotlib.pyplot as plt
 
-from vertical import dz
-from horizontal import dh
-from total import dt
-from tilt import tilt, hyperbolic_tilt
+# run from any directory, e.g. 'python Filters/play.py'
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from Filters.gridio import open_grid
+from Filters.spectral import SpectralGrid
+from Filters.registry import run_filter
+from Filters.vertical import dz_sweep
+from Filters.filterbank import compute_edge_attributes
+from Filters.cache import ResultCache
+from Filters.render import render_figures
 
 def plot_edges(size):
     # First Break - Hingeline
@@ -53,119 +62,36 @@ def plot_edges(size):
     plt.plot([-50, -0.95], [-35, -10], color='0.35', linewidth=2.5,
              linestyle='--')
 
-# Open File "data.dat" and import data
-data = np.loadtxt("data.dat")
-xp = data[:, 0]
-yp = data[:, 1]
-zp = data[:, 2]
-tf = data[:, 3]
-
-grd_shape = (200, 200)
-
-xp = np.reshape(xp, grd_shape)
-yp = np.reshape(yp, grd_shape)
-zp = np.reshape(zp, grd_shape)
-tf = np.reshape(tf, grd_shape)
-
-# Plotting the total-field anomaly
-fig = plt.figure(figsize=(10, 10))
-plt.title('Total Field Anomaly')
-plt.gca().set_aspect('equal', adjustable='box')
-plt.contourf(yp/1000, xp/1000, tf, 50, cmap=plt.cm.RdBu_r)
-cb = plt.colorbar()
-cb.set_label("nT", labelpad=30, rotation=0)
-plt.xlabel('Easting Coordinate (km)')
-plt.ylabel('Northing Coordinate (km)')
-plot_edges(3)
-fig.savefig('Total Field.png')
-
-# first vertical derivatives
-dz1 = dz(tf, xp, yp)
-fig = plt.figure(figsize=(10, 10))
-plt.title('First Vertical Derivative')
-plt.gca().set_aspect('equal', adjustable='box')
-plt.contourf(yp/1000, xp/1000, dz1, 50, cmap=plt.cm.RdBu_r)
-cb = plt.colorbar()
-cb.set_label("nT/m", labelpad=30, rotation=0)
-plt.xlabel('Easting Coordinate (km)')
-plt.ylabel('Northing Coordinate (km)')
-plot_edges(3)
-fig.savefig('dz1.png')
-
-# second vertical derivative
-dz2 = dz(tf, xp, yp, 2)
-fig = plt.figure(figsize=(10, 10))
-plt.title('Second Vertical Derivative')
-plt.gca().set_aspect('equal', adjustable='box')
-plt.contourf(yp/1000, xp/1000, dz2, 50, cmap=plt.cm.RdBu_r)
-cb = plt.colorbar()
-cb.set_label("nT/sq m", labelpad=30, rotation=0)
-plt.xlabel('Easting Coordinate (km)')
-plt.ylabel('Northing Coordinate (km)')
-plot_edges(3)
-fig.savefig('dz2.png')
-
-# 1.5-order vertical derivative
-dz1p5 = dz(tf, xp, yp, 1.5)
-fig = plt.figure(figsize=(10, 10))
-plt.title('1.5th-order Vertical Derivative')
-plt.gca().set_aspect('equal', adjustable='box')
-plt.contourf(yp/1000, xp/1000, dz1p5, 50, cmap=plt.cm.RdBu_r)
-cb = plt.colorbar()
-cb.set_label("nT/m^1.5", labelpad=30, rotation=0)
-plt.xlabel('Easting Coordinate (km)')
-plt.ylabel('Northing Coordinate (km)')
-plot_edges(3)
-fig.savefig('dz1p5.png')
-
-# total horizontal derivative
-thd = dh(tf, xp, yp)
-fig = plt.figure(figsize=(10, 10))
-plt.title('Total Horizontal Derivative')
-plt.gca().set_aspect('equal', adjustable='box')
-plt.contourf(yp/1000, xp/1000, thd, 50, cmap=plt.cm.RdBu_r)
-cb = plt.colorbar()
-cb.set_label("nT/m", labelpad=30, rotation=0)
-plt.xlabel('Easting Coordinate (km)')
-plt.ylabel('Northing Coordinate (km)')
-plot_edges(3)
-fig.savefig('thd.png')
-
-# total derivative
-td = dt(tf, xp, yp)
-fig = plt.figure(figsize=(10, 10))
-plt.title('Total Derivative')
-plt.gca().set_aspect('equal', adjustable='box')
-plt.contourf(yp/1000, xp/1000, td, 50, cmap=plt.cm.RdBu_r)
-cb = plt.colorbar()
-cb.set_label("nT/m", labelpad=30, rotation=0)
-plt.xlabel('Easting Coordinate (km)')
-plt.ylabel('Northing Coordinate (km)')
-plot_edges(3)
-fig.savefig('td.png')
-
-# tilt angle
-theta = tilt(tf, xp, yp)
-fig = plt.figure(figsize=(10, 10))
-plt.title('Tilt Angle')
-plt.gca().set_aspect('equal', adjustable='box')
-plt.contourf(yp/1000, xp/1000, theta, 50, cmap=plt.cm.RdBu_r)
-cb = plt.colorbar()
-cb.set_label("Radians", labelpad=30, rotation=0)
-plt.xlabel('Easting Coordinate (km)')
-plt.ylabel('Northing Coordinate (km)')
-plot_edges(3)
-fig.savefig('tilt.png')
-
-# hyperbolic tilt angle
-hta = hyperbolic_tilt(tf, xp, yp)
-fig = plt.figure(figsize=(10, 10))
-plt.title('Hyperbolic Tilt Angle')
-plt.gca().set_aspect('equal', adjustable='box')
-plt.contourf(yp/1000, xp/1000, hta, 50, cmap=plt.cm.RdBu_r)
-cb = plt.colorbar()
-cb.set_label("Radians", labelpad=30, rotation=0)
-plt.xlabel('Easting Coordinate (km)')
-plt.ylabel('Northing Coordinate (km)')
-plot_edges(3)
-fig.savefig('hta.png')
+if __name__ == '__main__':
+    # Open File "data.dat" beside this script (converted to a binary grid on
+    # first use)
+    tf, geometry = open_grid(os.path.join(HERE, "data.dat"))
+
+    # pad and transform the total-field anomaly once for every filter below
+    grid = SpectralGrid(tf, geometry)
+
+    # results are kept on disk, so running the script again only replots them
+    cache = ResultCache('.filter_cache')
+
+    # first-order attributes, sharing the x, y and z derivatives
+    edges = compute_edge_attributes(grid,
+                                    attrs=['dz', 'dh', 'dt', 'tilt', 'hta'],
+                                    cache=cache)
+
+    # second and 1.5-order vertical derivatives, in one sweep of orders
+    (dz2, dz1p5), = run_filter(dz_sweep, grid, cache=cache, orders=(2, 1.5))
+
+    # render every map concurrently, as raster images (pass mode='contour'
+    # for filled contours)
+    figures = [
+        ('Total Field.png', [(tf, 'Total Field Anomaly', 'nT')]),
+        ('dz1.png', [(edges['dz'], 'First Vertical Derivative', 'nT/m')]),
+        ('dz2.png', [(dz2, 'Second Vertical Derivative', 'nT/sq m')]),
+        ('dz1p5.png', [(dz1p5, '1.5th-order Vertical Derivative',
+                        'nT/m^1.5')]),
+        ('thd.png', [(edges['dh'], 'Total Horizontal Derivative', 'nT/m')]),
+        ('td.png', [(edges['dt'], 'Total Derivative', 'nT/m')]),
+        ('tilt.png', [(edges['tilt'], 'Tilt Angle', 'Radians')]),
+        ('hta.png', [(edges['hta'], 'Hyperbolic Tilt Angle', 'Radians')]),
+    ]
+    render_figures(figures, geometry, overlay=functools.partial(plot_edges, 3))
@@ -0,0 +1,166 @@
+"""
+    Profiling
+
+    A Python program to record the wall time and memory of each stage of the
+    filters: 'pad', 'fft' (forward transform), 'kernel' (building a filter on
+    a kernel-cache miss), 'multiply' (filter times spectrum), 'ifft' (inverse
+    transform), 'unpad' (cropping to the data) and 'attributes' (monogenic
+    amplitude, phase and orientation).
+
+    Nothing is recorded unless a hook is active, and the instrumented code
+    then only pays one test of a global list per stage:
+
+        with profile() as stages:
+            pss_monogenic_signal(x, y, tf, hc=500, hf=450)
+        print(stages.report())
+
+    Any callable taking (stage, seconds, nbytes) can also be registered with
+    add_hook, e.g. to feed an external metrics system. 'nbytes' is the peak
+    memory the stage allocated, temporaries included (padding ramps, backend
+    scratch buffers, kernel intermediates, as well as its results), measured
+    with tracemalloc, which numpy reports its array data to. Tracing is
+    started while a hook is registered, if it was not already, and slows the
+    allocations down.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+# the active hooks, called as hook(stage, seconds, nbytes)
+_hooks = []
+
+# whether the hooks started tracemalloc, and so must stop it
+_tracing = []
+
+# the stages being timed, innermost last, as [traced memory at the start,
+# highest traced memory seen before an inner stage reset the peak]
+_stages = []
+
+def start():
+    """
+    Starts timing a stage and measuring its allocations.
+
+    Returns:
+        * t: tuple or None
+            The start of the stage, or None when no hook is active.
+    """
+
+    if not _hooks:
+        return None
+
+    # the peak is reset for this stage: the enclosing stages keep theirs
+    current, peak = tracemalloc.get_traced_memory()
+    for outer in _stages:
+        outer[1] = max(outer[1], peak)
+    tracemalloc.reset_peak()
+    _stages.append([current, current])
+
+    return perf_counter(), len(_stages)
+
+def stop(stage, t):
+    """
+    Stops timing a stage and reports it to every active hook. Does nothing if
+    't' is None (see start).
+
+    Arguments:
+        * stage: str
+            Name of the stage.
+        * t: tuple or None
+            The value returned by start.
+    """
+
+    if t is None or len(_stages) < t[1]:
+        return
+
+    seconds = perf_counter() - t[0]
+    # drop any stage left open by an exception
+    del _stages[t[1]:]
+    current, highest = _stages.pop()
+    size = max(highest, tracemalloc.get_traced_memory()[1]) - current
+    for hook in list(_hooks):
+        hook(stage, seconds, size)
+
+def add_hook(hook):
+    """
+    Registers a callable, called as hook(stage, seconds, nbytes) at the end
+    of every stage, and starts tracing allocations if needed.
+    """
+
+    if not _hooks and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _tracing.append(True)
+    _hooks.append(hook)
+
+def remove_hook(hook):
+    """
+    Unregisters a hook.
+    """
+
+    if hook in _hooks:
+        _hooks.remove(hook)
+    if not _hooks:
+        del _stages[:]
+        if _tracing:
+            tracemalloc.stop()
+            del _tracing[:]
+
+class StageProfile(object):
+    """
+    Hook accumulating the calls, time and memory of each stage.
+
+    Attributes:
+        * stages: dict
+            Per stage name, a dict with the number of 'calls', the total
+            'seconds' and the total 'nbytes' allocated.
+    """
+
+    def __init__(self):
+
+        self.stages = {}
+
+    def __call__(self, stage, seconds, nbytes):
+
+        totals = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0,
+                                                'nbytes': 0})
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['nbytes'] += nbytes
+
+    def report(self):
+        """
+        Formats the totals of each stage, slowest first, as a table.
+        """
+
+        total = sum(s['seconds'] for s in self.stages.values()) or 1.0
+        lines = ['%-12s %6s %10s %6s %10s'
+                 % ('stage', 'calls', 'seconds', '%', 'alloc MiB')]
+        for stage, s in sorted(self.stages.items(),
+                               key=lambda item: -item[1]['seconds']):
+            lines.append('%-12s %6d %10.4f %6.1f %10.1f'
+                         % (stage, s['calls'], s['seconds'],
+                            100 * s['seconds'] / total, s['nbytes'] / 2.**20))
+
+        return '\n'.join(lines)
+
+@contextmanager
+def profile(hook=None):
+    """
+    Records the stages run within a 'with' block.
+
+    Arguments:
+        * hook: callable
+            Hook to register for the block. Defaults to a new StageProfile.
+
+    Yields:
+        * hook: the registered hook.
+    """
+
+    hook = StageProfile() if hook is None else hook
+    add_hook(hook)
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
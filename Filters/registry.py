@@ -0,0 +1,243 @@
+"""
+    Registry
+
+    A Python program to look filters up by name with a common calling
+    convention, for the executors that run them on tiles, strips or batches of
+    grids.
+
+    Every registered filter is called as func(f, x, y, **params) and returns
+    one 2d-array per name in its 'outputs'.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import inspect
+import functools
+import numpy as np
+from Filters.vertical import dz
+from Filters.horizontal import dh, dx_fft, dy_fft
+from Filters.total import dt
+from Filters.tilt import tilt, hyperbolic_tilt
+from Filters.spectral import SpectralGrid
+from Filters.geometry import as_geometry
+from Filters.fft_processing import float_type
+from Filters.fft_backends import get_backend
+from Monogenic.monogenic import nss_monogenic_signal, pss_monogenic_signal
+
+MONOGENIC_OUTPUTS = ('amplitude', 'phase', 'orientation')
+
+def monogenic_filter(func):
+    """
+    Adapts a monogenic signal function, called as func(x, y, data, ...), to
+    the common calling convention.
+    """
+
+    @functools.wraps(func)
+    def run(f, x=None, y=None, **params):
+        return func(x, y, f, **params)
+
+    return run
+
+# registered filters: name -> (function, names of its outputs)
+FILTERS = {
+    'dz': (dz, ('dz',)),
+    'dx': (dx_fft, ('dx',)),
+    'dy': (dy_fft, ('dy',)),
+    'dh': (dh, ('dh',)),
+    'dt': (dt, ('dt',)),
+    'tilt': (tilt, ('tilt',)),
+    'hta': (hyperbolic_tilt, ('hta',)),
+    'nss': (monogenic_filter(nss_monogenic_signal), MONOGENIC_OUTPUTS),
+    'pss': (monogenic_filter(pss_monogenic_signal), MONOGENIC_OUTPUTS),
+}
+
+def register_filter(name, func, outputs=None):
+    """
+    Registers a filter.
+
+    Arguments:
+        * name: str
+            Name of the filter.
+        * func: callable
+            Called as func(f, x, y, **params).
+        * outputs: tuple of str
+            Names of the arrays returned by func. Defaults to (name,), a single
+            array.
+    """
+
+    FILTERS[name] = (func, tuple(outputs or (name,)))
+
+def get_filter(name):
+    """
+    Looks a filter up.
+
+    Arguments:
+        * name: str or callable
+            Name of a registered filter. A callable is returned as a filter
+            with a single output.
+
+    Returns:
+        * func: callable
+            The filter, called as func(f, x, y, **params).
+        * outputs: tuple of str
+            Names of its outputs.
+    """
+
+    if callable(name):
+        return name, (getattr(name, '__name__', 'output'),)
+    if name not in FILTERS:
+        raise ValueError("Unknown filter '%s', expected one of %s"
+                         % (name, ', '.join(sorted(FILTERS))))
+
+    return FILTERS[name]
+
+def filter_label(name, params):
+    """
+    Names the output of a filter run, e.g. 'dz_n1.5' for ('dz', {'n': 1.5}).
+    """
+
+    return '_'.join([name] + ['%s%s' % (k, params[k]) for k in sorted(params)])
+
+def filter_specs(filters):
+    """
+    Normalizes a suite of filters given as names or (name, params) pairs,
+    e.g. ['dz', ('dz', {'n': 1.5}), 'tilt'], into (name, params) pairs.
+    """
+
+    return [(spec, {}) if isinstance(spec, str) else (spec[0], dict(spec[1]))
+            for spec in filters]
+
+def filter_parameters(name, params):
+    """
+    Completes the parameters of a filter run with the defaults of the filter
+    function, e.g. {'n': 1} for 'dz', so runs relying on a default and runs
+    giving it explicitly are recognized as the same.
+
+    Arguments:
+        * name: str or callable
+            Name of a registered filter, or a filter function.
+        * params: dict
+            The given parameters.
+
+    Returns:
+        * params: dict
+            Every parameter of the filter.
+    """
+
+    func, _ = get_filter(name)
+    full = {}
+    for arg in inspect.signature(func).parameters.values():
+        if (arg.default is not arg.empty
+                and arg.name not in ('f', 'x', 'y', 'data')):
+            full[arg.name] = arg.default
+    full.update(params)
+
+    return full
+
+def source_parts(f, x=None, y=None):
+    """
+    Describes the input of a filter run for a result-cache key: the data,
+    its geometry and how it is padded and transformed.
+
+    Arguments:
+        * f: 2d-array or SpectralGrid
+            Array with the data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points.
+
+    Returns:
+        * parts: tuple
+    """
+
+    if isinstance(f, SpectralGrid):
+        return (f.data, f.geometry, f.n_pts, f.mode, f.real, f.fast_len,
+                f.backend.name, f.dtype.str)
+
+    f = np.asarray(f)
+
+    return (f, as_geometry(x, y, f.shape[-2:]), float_type(f).str,
+            get_backend().name)
+
+def result_key(cache, name, f, x=None, y=None, params=None):
+    """
+    Builds the result-cache key of a filter run from the content of the data,
+    its geometry, padding and precision, the FFT backend and every parameter
+    of the filter (see cache.ResultCache).
+    """
+
+    params = filter_parameters(name, params or {})
+    if params.get('backend') is not None:
+        params['backend'] = get_backend(params['backend']).name
+    label = name if isinstance(name, str) else \
+        '%s.%s' % (name.__module__, name.__name__)
+
+    parts = [label] + list(source_parts(f, x, y))
+    for key in sorted(params):
+        parts += [key, params[key]]
+
+    return cache.key(*parts)
+
+def run_filter(name, f, x=None, y=None, cache=None, **params):
+    """
+    Runs a filter and always returns its outputs as a tuple.
+
+    Arguments:
+        * name: str or callable
+            Name of a registered filter, or a filter function.
+        * f: 2d-array or SpectralGrid
+            Array with the data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points.
+        * cache: ResultCache
+            Optional cache of results (see cache.py). The filter only runs
+            if the same data, geometry and parameters were not already
+            cached.
+        * params: keyword arguments
+            Parameters of the filter, e.g. n=1.5 for 'dz'.
+
+    Returns:
+        * outputs: tuple of 2d-arrays
+    """
+
+    if cache is not None:
+        key = result_key(cache, name, f, x, y, params)
+        return cache.get(key, lambda: run_filter(name, f, x, y, **params))
+
+    func, outputs = get_filter(name)
+    result = func(f, x, y, **params)
+    if len(outputs) == 1:
+        return (result,)
+
+    return tuple(result)
+
+def precision_error(name, f, x=None, y=None, **params):
+    """
+    Measures the difference between the single- and double-precision results
+    of a filter, to check single precision is accurate enough for a survey.
+
+    On the synthetic model (Filters/data.dat) the errors stay below 1e-5 for
+    the derivatives and amplitudes, and below 2e-4 for the angles (tilt and
+    the monogenic phase and orientation, least accurate near their singular
+    points). tests/test_precision.py checks these bounds.
+
+    Arguments:
+        * name: str or callable
+            Name of a registered filter, or a filter function.
+        * f: 2d-array
+            Array with the data.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points.
+        * params: keyword arguments
+            Parameters of the filter.
+
+    Returns:
+        * errors: list of floats
+            Maximum absolute difference of each output, relative to the
+            maximum absolute double-precision value.
+    """
+
+    double = run_filter(name, np.array(f, np.float64), x, y, **params)
+    single = run_filter(name, np.array(f, np.float32), x, y, **params)
+
+    return [np.nanmax(np.abs(s - d)) / np.nanmax(np.abs(d))
+            for s, d in zip(single, double)]
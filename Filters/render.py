@@ -0,0 +1,192 @@
+"""
+    Render
+
+    A Python program to save maps of gridded data and filter results as image
+    files, rendering the figures concurrently in a pool of processes with the
+    non-interactive Agg backend.
+
+    By default each grid is drawn as a raster image (imshow), first reduced
+    by block averaging to the resolution of its panel on screen. Filled
+    contours (contourf), much slower on large grids, are only drawn when
+    mode='contour' is requested, from the same reduced grid. Only the
+    reduced grids are sent to the worker processes.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Filters.geometry import GridGeometry, as_geometry
+
+def downsample(data, geometry, shape):
+    """
+    Reduces a grid to at most 'shape' points by averaging blocks of points,
+    ignoring NaNs.
+
+    Arguments:
+        * data: 2d-array
+            Array with the gridded data.
+        * geometry: GridGeometry
+            Origin, sample spacing and shape of the grid.
+        * shape: tuple = (ny, nx)
+            Largest number of points in each direction.
+
+    Returns:
+        * data: 2d-array
+            The block averages.
+        * geometry: GridGeometry
+            The geometry of the block centres.
+    """
+
+    ny, nx = np.shape(data)
+    fy = -(-ny // shape[0])
+    fx = -(-nx // shape[1])
+    if fy == 1 and fx == 1:
+        return np.asarray(data), geometry
+
+    # pad the last blocks with NaNs, which the averages ignore
+    my, mx = -(-ny // fy), -(-nx // fx)
+    blocks = np.full((my*fy, mx*fx), np.nan)
+    blocks[:ny, :nx] = data
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        reduced = np.nanmean(blocks.reshape(my, fy, mx, fx), axis=(1, 3))
+
+    (x0, y0), (dx, dy) = geometry.origin, geometry.spacing
+    geometry = GridGeometry((x0 + (fx - 1)*dx/2, y0 + (fy - 1)*dy/2),
+                            (fx*dx, fy*dy), (my, mx))
+
+    return reduced, geometry
+
+def use_agg():
+    """
+    Worker initializer: selects the non-interactive Agg backend.
+    """
+
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+def render_figure(path, panels, geometry, size=(10, 10), mode='raster',
+                  levels=50, cmap='RdBu_r', scale=1e-3, overlay=None,
+                  dpi=100, xlabel='Easting Coordinate (km)',
+                  ylabel='Northing Coordinate (km)'):
+    """
+    Draws a row of maps into one figure and saves it.
+
+    Arguments:
+        * path: str
+            Path of the image file.
+        * panels: list of (data, title, label)
+            The grid, title and colour-bar label of each map.
+        * geometry: GridGeometry
+            Origin, sample spacing and shape of the grids.
+        * size: tuple = (width, height)
+            Figure size in inches. Defaults to (10, 10).
+        * mode: str
+            'raster' for images (imshow), or 'contour' for filled contours
+            (contourf). Defaults to 'raster'.
+        * levels: int
+            Number of contour levels. Defaults to 50.
+        * cmap: str
+            Colour map. Defaults to 'RdBu_r'.
+        * scale: float
+            Factor converting the coordinates to the axis units. Defaults to
+            1e-3 (m to km).
+        * overlay: callable
+            Optional function without arguments drawing over each map, e.g.
+            functools.partial(plot_edges, 3). Must be defined at module level
+            to reach the worker processes.
+        * dpi: int
+            Resolution of the image file. Defaults to 100.
+        * xlabel, ylabel: str
+            Axis labels.
+
+    Returns:
+        * path: str
+    """
+
+    import matplotlib.pyplot as plt
+
+    # colour-bar labels sit beside a single map, along the bar of several
+    single = len(panels) == 1
+
+    fig = plt.figure(figsize=size)
+    for i, (data, title, label) in enumerate(panels):
+        plt.subplot(1, len(panels), i + 1)
+        plt.title(title)
+        plt.gca().set_aspect('equal', adjustable='box')
+        if mode == 'contour':
+            xp, yp = geometry.coordinates()
+            plt.contourf(xp*scale, yp*scale, data, levels, cmap=cmap)
+        elif mode == 'raster':
+            (x0, y0), (dx, dy) = geometry.origin, geometry.spacing
+            ny, nx = geometry.shape
+            extent = [(x0 - dx/2)*scale, (x0 + (nx - 0.5)*dx)*scale,
+                      (y0 - dy/2)*scale, (y0 + (ny - 0.5)*dy)*scale]
+            plt.imshow(data, cmap=cmap, origin='lower', extent=extent,
+                       interpolation='nearest')
+        else:
+            raise ValueError("Unknown mode '%s', expected 'raster' or "
+                             "'contour'" % mode)
+        if single:
+            cb = plt.colorbar()
+            cb.set_label(label, labelpad=30, rotation=0)
+        else:
+            cb = plt.colorbar(pad=0.05)
+            cb.set_label(label, labelpad=5, rotation=90)
+        plt.xlabel(xlabel)
+        plt.ylabel(ylabel)
+        if overlay is not None:
+            overlay()
+
+    fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+
+    return path
+
+def render_figures(figures, x, y=None, workers=None, **options):
+    """
+    Renders figures concurrently in a pool of processes (see render_figure).
+
+    Arguments:
+        * figures: list of (path, panels), or (path, panels, options)
+            The image file and the (data, title, label) maps of each figure,
+            with optional keyword arguments of render_figure for that figure.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points.
+        * workers: int
+            Number of processes. Defaults to the number of CPUs.
+        * options: keyword arguments
+            Keyword arguments of render_figure shared by every figure, e.g.
+            mode='contour' or overlay=functools.partial(plot_edges, 3).
+
+    Returns:
+        * paths: list of str
+            Paths of the saved images.
+    """
+
+    tasks = []
+    for figure in figures:
+        path, panels = figure[:2]
+        kwargs = dict(options)
+        if len(figure) > 2:
+            kwargs.update(figure[2])
+
+        # reduce each grid to the pixels of its panel before sending it
+        size = kwargs.get('size', (10, 10))
+        dpi = kwargs.get('dpi', 100)
+        shape = (int(size[1]*dpi), int(size[0]*dpi) // len(panels))
+        reduced = []
+        for data, title, label in panels:
+            geometry = as_geometry(x, y, np.shape(data))
+            data, small = downsample(data, geometry, shape)
+            reduced.append((data, title, label))
+        tasks.append((path, reduced, small, kwargs))
+
+    with ProcessPoolExecutor(workers, initializer=use_agg) as pool:
+        futures = [pool.submit(render_figure, path, panels, geometry,
+                               **kwargs)
+                   for path, panels, geometry, kwargs in tasks]
+
+        return [future.result() for future in futures]
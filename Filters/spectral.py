@@ -0,0 +1,222 @@
+"""
+    Spectral
+
+    A Python program holding the padded Fourier Transform of a 2d-array so that
+    every wavenumber-domain filter can share a single forward transform.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import numpy as np
+from Filters.fft_processing import fft_pad_data, ifft_unpad_data, \
+    wavenumber_grids, fold_nyquist, float_type
+from Filters.fft_backends import get_backend
+from Filters.cache import kernel_cache
+from Filters.geometry import as_geometry
+from Filters import profiling
+
+class SpectralGrid(object):
+    """
+    The padded Fourier Transform of a 2d-array together with everything needed
+    to filter it in the wavenumber domain and return to the spatial domain.
+
+    The data is padded and transformed once on creation. Any filter accepting
+    a SpectralGrid in place of its data array reuses the stored spectrum, so a
+    full suite of filters costs one forward FFT plus one inverse per output.
+
+    A stack of grids with the same geometry, a (batch, ny, nx) array, is
+    padded and transformed in one call. Every filter kernel is built once for
+    the grid geometry and broadcast over the stack, and the results are
+    stacked the same way.
+
+    By default only the half-spectrum of the real data is kept (rfft2), which
+    halves the transform time and the spectrum memory. Filters built from the
+    u, v, r attributes give the same results as the full spectrum.
+
+    In single precision the data, spectrum, filters and results are float32
+    and complex64. The wavenumbers stay in double precision, so the filters
+    are evaluated accurately and only rounded once.
+
+    Arguments:
+        * f: 2d-array or 3d-array
+            Array with the gridded data, or a (batch, ny, nx) stack of grids.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points.
+        * n_pts: int
+            Number of array points to pad the data with. Defaults to 10.
+        * mode: str
+            Padding mode (see fft_pad_data). Defaults to 'linear_ramp'.
+        * real: bool
+            Keep only the half-spectrum. Defaults to True.
+        * backend: str or backend object
+            FFT backend used for the forward and every inverse transform (see
+            fft_backends). Defaults to the global default.
+        * fast_len: bool
+            Grow the padded grid to fast FFT lengths, keeping at least 'n_pts'
+            padding points on each side (see pad_widths). Defaults to False.
+        * dtype: data type
+            Precision, np.float32 or np.float64 (see float_type). Defaults to
+            the precision of 'f'.
+
+    Attributes:
+        * data: 2d-array or 3d-array
+            The unpadded spatial-domain data, in the grid precision.
+        * dtype: np.dtype
+            The grid precision, np.float32 or np.float64.
+        * shape: tuple = (ny, nx) or (batch, ny, nx)
+            The shape of the data before padding.
+        * shape_pdat: tuple = (ny, nx)
+            The number of data points in each direction after padding.
+        * geometry: GridGeometry
+            Origin, sample spacing and shape of the data grid.
+        * dx, dy: floats
+            The sample spacing in the x and y directions.
+        * F: 2d-array
+            The FFT of the padded data.
+        * pad: PadDescriptor
+            Location of the data in the padded grid (see fft_pad_data).
+        * mask: 2d-array
+            Location of the padding points (True: data, False: padding),
+            built on request from 'pad'.
+        * u, v, r: 2d-arrays
+            x, y and radial Fourier wavenumbers of the padded grid (see
+            fft_wavenumbers for their layout in half-spectrum mode). They are
+            shared through the kernel cache and read-only.
+    """
+
+    def __init__(self, f, x, y=None, n_pts=10, mode='linear_ramp', real=True,
+                 backend=None, fast_len=False, dtype=None):
+
+        self.dtype = float_type(f, dtype)
+        self.data = np.asarray(f, self.dtype)
+        self.shape = np.shape(f)
+        self.n_pts = n_pts
+        self.mode = mode
+        self.real = real
+        self.backend = get_backend(backend)
+        self.fast_len = fast_len
+
+        # the grid geometry and its sample spacing in the x and y directions
+        self.geometry = as_geometry(x, y, self.shape[-2:])
+        self.dx, self.dy = self.geometry.spacing
+
+        # calculate the Fourier Transform of the data and the wavenumbers
+        self.F, self.pad = fft_pad_data(self.data, n_pts, mode, real,
+                                        self.backend, fast_len)
+        self.shape_pdat = self.pad.shape
+        self.u, self.v, self.r = wavenumber_grids(self.dx, self.dy,
+                                                  self.shape_pdat, real)
+
+    @property
+    def mask(self):
+        return self.pad.mask
+
+    def kernel(self, name, build, *params):
+        """
+        Returns a wavenumber-domain filter for this grid geometry from the
+        kernel cache (see cache.py), building it with 'build()' on a miss.
+
+        The filter is cached ready to multiply the spectrum (folded in
+        half-spectrum mode, in the grid precision) and read-only, so any later
+        grid with the same padded shape, sample spacing, mode and precision
+        reuses it.
+
+        Arguments:
+            * name: str
+                Name of the filter.
+            * build: callable
+                Function without arguments returning the filter (or a tuple
+                of filters) from the u, v, r attributes.
+            * params: floats
+                Parameters of the filter, e.g. the order of a derivative.
+
+        Returns:
+            * K: 2d-array or tuple of 2d-arrays
+                The filter(s).
+        """
+
+        def build_folded():
+            t = profiling.start()
+            K = build()
+            if isinstance(K, tuple):
+                K = tuple(self._prepare(k) for k in K)
+            else:
+                K = self._prepare(K)
+            profiling.stop('kernel', t)
+            return K
+
+        key = (name, self.shape_pdat, self.dx, self.dy, self.real,
+               self.dtype.str) + params
+
+        return kernel_cache.get(key, build_folded)
+
+    def _prepare(self, K):
+        """
+        Folds a filter (in half-spectrum mode) and rounds it to the grid
+        precision.
+        """
+
+        if self.real:
+            K = fold_nyquist(K, self.shape_pdat)
+        if self.dtype == np.float32 and np.ndim(K):
+            K = K.astype(np.complex64 if np.iscomplexobj(K) else np.float32,
+                         copy=False)
+
+        return K
+
+    def inverse(self, K):
+        """
+        Applies a wavenumber-domain filter to the stored spectrum and returns
+        the unpadded spatial-domain result.
+
+        Arguments:
+            * K: 2d-array or scalar
+                Filter to multiply the spectrum with, usually built from the
+                u, v, r attributes.
+
+        Returns:
+            * f: 2d-array
+                The filtered, unpadded spatial-domain data.
+        """
+
+        t = profiling.start()
+        KF = self._prepare(K) * self.F
+        profiling.stop('multiply', t)
+
+        return ifft_unpad_data(KF, self.pad, self.shape, self.real,
+                               self.backend)
+
+def as_spectral_grid(f, x, y=None, n_pts=10, mode='linear_ramp', real=True,
+                     backend=None, fast_len=False, dtype=None):
+    """
+    Returns 'f' unchanged if it is already a SpectralGrid, otherwise pads and
+    transforms it into one.
+
+    Arguments:
+        * f: 2d-array, 3d-array or SpectralGrid
+            Array with the gridded data, or a (batch, ny, nx) stack of grids.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Ignored
+            when 'f' is a SpectralGrid.
+        * n_pts: int
+            Number of array points to pad the data with. Defaults to 10.
+        * mode: str
+            Padding mode (see fft_pad_data). Defaults to 'linear_ramp'.
+        * real: bool
+            Keep only the half-spectrum. Defaults to True.
+        * backend: str or backend object
+            FFT backend (see fft_backends). Defaults to the global default.
+        * fast_len: bool
+            Grow the padded grid to fast FFT lengths. Defaults to False.
+        * dtype: data type
+            Precision (see float_type). Defaults to the precision of 'f'.
+
+    Returns:
+        * grid: SpectralGrid
+            The spectral context of the data.
+    """
+
+    if isinstance(f, SpectralGrid):
+        return f
+
+    return SpectralGrid(f, x, y, n_pts, mode, real, backend, fast_len, dtype)
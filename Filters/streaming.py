@@ -0,0 +1,195 @@
+"""
+    Streaming
+
+    A Python program to run filters on a survey delivered in strips of rows
+    (e.g. survey lines, as the acquisition progresses), yielding each strip of
+    results as soon as enough neighbouring rows have arrived.
+
+    The incoming rows go into a sliding buffer. Rows are finalized in blocks:
+    a block is filtered, together with 'overlap' rows of context on each side,
+    once the rows after it have arrived, and only the context still needed is
+    kept. The results are exactly those of tiling.apply_tiled with tiles of
+    (block, nx) points and the same overlap, so the error bound documented in
+    tiling applies: finite-difference filters (dh, tilt's horizontal part,
+    dz with n=2) are exact, the spectral filters approach the whole-survey
+    result as the overlap grows.
+
+    Memory is bounded by the buffer, about (block + 2*overlap + strip) rows,
+    whatever the length of the survey.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import numpy as np
+from Filters.registry import get_filter, run_filter, filter_label, \
+    filter_specs
+from Filters.spectral import SpectralGrid
+from Filters.geometry import GridGeometry
+
+class StripPipeline(object):
+    """
+    Sliding-buffer pipeline running a suite of filters on a survey pushed in
+    strips of rows. Every block of rows shares a single forward transform
+    between the filters.
+
+    Arguments:
+        * filters: list
+            Filter names (see registry), or (name, params) pairs, e.g.
+            ['dz', 'dh', 'tilt', ('pss', {'hc': 500, 'hf': 450})].
+        * geometry: GridGeometry
+            Origin, sample spacing and number of columns of the survey. Its
+            number of rows is ignored.
+        * overlap: int
+            Number of context rows on each side of a block. Defaults to 64.
+        * block: int
+            Number of rows finalized at once. Smaller blocks give results
+            sooner, larger blocks cost fewer transforms. Defaults to 256.
+
+    Attributes:
+        * rows: int
+            Number of rows received so far.
+        * done: int
+            Number of rows finalized so far.
+    """
+
+    def __init__(self, filters, geometry, overlap=64, block=256):
+
+        self.filters = filter_specs(filters)
+        self.geometry = geometry
+        self.overlap = overlap
+        self.block = block
+        self.window = block + 2*overlap
+        self.rows = 0
+        self.done = 0
+
+        # output names of every filter
+        self.labels = []
+        for name, params in self.filters:
+            _, outputs = get_filter(name)
+            label = filter_label(name, params)
+            self.labels.append([label] if len(outputs) == 1 else
+                               ['%s_%s' % (label, out) for out in outputs])
+
+        # the buffered rows, starting with global row 'first'
+        self._buffer = np.empty((0, geometry.shape[1]))
+        self._first = 0
+
+    def push(self, strip):
+        """
+        Adds rows to the survey.
+
+        Arguments:
+            * strip: 1d-array or 2d-array
+                The next survey line, or the next rows of the survey.
+
+        Returns:
+            * results: list of (rows, outputs)
+                The blocks finalized by these rows (see process).
+        """
+
+        strip = np.atleast_2d(strip)
+        if strip.shape[1] != self.geometry.shape[1]:
+            raise ValueError('Expected strips of %d columns, got %d'
+                             % (self.geometry.shape[1], strip.shape[1]))
+
+        if len(self._buffer):
+            self._buffer = np.concatenate([self._buffer, strip])
+        else:
+            self._buffer = np.array(strip)
+        self.rows += len(strip)
+
+        results = []
+        while True:
+            w0 = max(self.done - self.overlap, 0)
+            if self.rows < w0 + self.window:
+                break
+            results.append(self.process(w0, w0 + self.window, self.done,
+                                        self.done + self.block))
+
+        # keep the context of the next block, and enough rows for a full
+        # window at the end of the survey
+        keep = max(min(self.done - self.overlap, self.rows - self.window), 0)
+        self._buffer = self._buffer[keep - self._first:]
+        self._first = keep
+
+        return results
+
+    def close(self):
+        """
+        Finalizes the remaining rows at the end of the survey, with windows
+        shifted inwards as in tiling.axis_windows.
+
+        Returns:
+            * results: list of (rows, outputs)
+                The remaining blocks (see process).
+        """
+
+        results = []
+        while self.done < self.rows:
+            start = self.done
+            stop = min(start + self.block, self.rows)
+            w0 = max(min(start - self.overlap, self.rows - self.window), 0)
+            results.append(self.process(w0, min(w0 + self.window, self.rows),
+                                        start, stop))
+
+        return results
+
+    def process(self, w0, w1, start, stop):
+        """
+        Runs the filters on buffered rows w0 to w1 and keeps the results of
+        rows 'start' to 'stop'.
+
+        Returns:
+            * rows: slice
+                The global rows of the results.
+            * outputs: dict
+                The results of each filter output, named as in
+                parallel.run_survey (e.g. 'dz_n1.5', 'pss_amplitude').
+        """
+
+        f = self._buffer[w0 - self._first:w1 - self._first]
+        (x0, y0), (_, dy) = self.geometry.origin, self.geometry.spacing
+        geometry = GridGeometry((x0, y0 + dy*w0), self.geometry.spacing,
+                                f.shape)
+        grid = SpectralGrid(f, geometry)
+
+        outputs = {}
+        for (name, params), labels in zip(self.filters, self.labels):
+            results = run_filter(name, grid, **params)
+            for label, result in zip(labels, results):
+                outputs[label] = result[start - w0:stop - w0].copy()
+        self.done = stop
+
+        return slice(start, stop), outputs
+
+def stream_filters(strips, filters, geometry, overlap=64, block=256):
+    """
+    Runs a suite of filters on a survey delivered in strips of rows, yielding
+    the results of each block of rows as soon as it is final (see
+    StripPipeline).
+
+    Arguments:
+        * strips: iterable
+            The survey lines or strips of rows, in order.
+        * filters: list
+            Filter names, or (name, params) pairs.
+        * geometry: GridGeometry
+            Origin, sample spacing and number of columns of the survey.
+        * overlap: int
+            Number of context rows on each side of a block. Defaults to 64.
+        * block: int
+            Number of rows finalized at once. Defaults to 256.
+
+    Yields:
+        * rows: slice
+            The global rows of the results.
+        * outputs: dict
+            The results of each filter output over those rows.
+    """
+
+    pipeline = StripPipeline(filters, geometry, overlap, block)
+    for strip in strips:
+        for result in pipeline.push(strip):
+            yield result
+    for result in pipeline.close():
+        yield result
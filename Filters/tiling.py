@@ -0,0 +1,231 @@
+"""
+    Tiling
+
+    A Python program to run a registered filter over a grid larger than memory,
+    one overlapping window at a time, writing the results into (optionally
+    memory-mapped) output arrays.
+
+    Each window holds a tile of the output plus 'overlap' points of context on
+    every side (fewer at the grid edges, where the window is shifted inwards so
+    all windows have the same shape and share their cached kernels). The filter
+    runs on the window, padded with the usual modes, and only the tile is kept.
+    Peak memory therefore scales with (tile + 2 * overlap)**2, not with the
+    survey size, when the input is a np.memmap (see gridio).
+
+    Error bound against the whole-grid result:
+
+        Points of a tile lying on the grid edge are processed exactly as in the
+        whole grid. Elsewhere, the window edge is at least 'overlap' points
+        away, and the tiled and whole-grid results differ only through the part
+        of the filter's impulse response h reaching past it:
+
+            |tiled - whole| <= 2 * max|f - fref| * sum(|h(s)|, |s| >= overlap)
+
+        where fref is the padding reference (0 for 'linear_ramp'). Hence:
+
+        * finite-difference filters (dh, dz with n=2) have a compact stencil
+          of n points per side and are exact for overlap >= n;
+        * spectral derivatives of order n (dz, dx, dy, and the dz term of dt,
+          which is therefore not exact either) have |h(s)| ~ |s|**-(2+n), so
+          the bound decays like overlap**-n;
+        * Poisson scale-space filters (pss) decay like (h / |s|)**3 beyond
+          their scale h, so an overlap of a few times hc / dx is enough;
+        * the Riesz kernel of the non-scale-space monogenic signal (nss)
+          falls off like |s|**-2, whose tail sum diverges: there is no bound,
+          and the amplitude error decreases only slowly with the overlap (of
+          the order of 1e-2 at overlap 64).
+
+        The bound only holds for these linear outputs. The angles (tilt, hta,
+        and the phase and orientation of nss and pss) are nonlinear functions
+        of them and have no bound: where their arguments are near zero, a
+        small difference flips them by up to pi, whatever the overlap, so
+        their tiled results may show seams between tiles.
+
+        tiling_error measures the actual error on a sample of the survey, to
+        choose the overlap.
+
+    Author: Joshua Poirier, 2017
+"""
+
+import os
+import numpy as np
+from Filters.registry import get_filter, run_filter
+from Filters.geometry import as_geometry
+
+def axis_windows(n, tile, overlap):
+    """
+    Splits one direction of a grid into overlapping windows.
+
+    Arguments:
+        * n: int
+            Number of data points in the direction.
+        * tile: int
+            Number of output points per tile.
+        * overlap: int
+            Number of context points on each side of a tile.
+
+    Returns:
+        * windows: list of (window, core, inner) slices
+            The points read, the output points written, and the output points
+            within the window.
+    """
+
+    win = min(n, tile + 2*overlap)
+    windows = []
+    for start in range(0, n, tile):
+        stop = min(start + tile, n)
+        w0 = min(max(start - overlap, 0), n - win)
+        windows.append((slice(w0, w0 + win), slice(start, stop),
+                        slice(start - w0, stop - w0)))
+
+    return windows
+
+def tile_windows(shape, tile_shape, overlap):
+    """
+    Splits a grid into overlapping windows.
+
+    Arguments:
+        * shape: tuple = (ny, nx)
+            The number of data points in each direction.
+        * tile_shape: tuple = (ty, tx)
+            The number of output points of a tile in each direction.
+        * overlap: int
+            Number of context points on each side of a tile.
+
+    Returns:
+        * windows: list of (window, core, inner) tuples of slices
+            The points read, the output points written, and the output points
+            within the window.
+    """
+
+    rows = axis_windows(shape[0], tile_shape[0], overlap)
+    cols = axis_windows(shape[1], tile_shape[1], overlap)
+
+    return [((wy, wx), (cy, cx), (iy, ix))
+            for wy, cy, iy in rows for wx, cx, ix in cols]
+
+def output_paths(out, outputs):
+    """
+    Names the files of a filter's outputs: 'out' for a single output, and
+    '<root>_<output><ext>' for several.
+    """
+
+    if len(outputs) == 1:
+        return [out]
+
+    root, ext = os.path.splitext(out)
+
+    return ['%s_%s%s' % (root, name, ext or '.npy') for name in outputs]
+
+def open_outputs(out, outputs, shape, dtype):
+    """
+    Allocates the output arrays of a filter.
+
+    Arguments:
+        * out: None, str or sequence of arrays
+            None for in-memory arrays, a .npy path for memory-mapped arrays
+            (see output_paths), or the arrays themselves.
+        * outputs: tuple of str
+            Names of the filter outputs.
+        * shape: tuple = (ny, nx)
+            Shape of each output.
+        * dtype: data type
+            Type of each output.
+
+    Returns:
+        * arrays: list of 2d-arrays
+    """
+
+    if out is None:
+        return [np.empty(shape, dtype) for _ in outputs]
+    if isinstance(out, str):
+        return [np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                          shape=shape)
+                for path in output_paths(out, outputs)]
+
+    return list(out) if len(outputs) > 1 else [out]
+
+def apply_tiled(name, f, x, y=None, tile_shape=(1024, 1024), overlap=64,
+                out=None, **params):
+    """
+    Runs a registered filter over a grid tile by tile (see the module
+    documentation for the error bound against the whole-grid result).
+
+    Arguments:
+        * name: str or callable
+            Name of a registered filter (see registry), or a filter function.
+        * f: 2d-array
+            Array with the data, usually a np.memmap.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points.
+        * tile_shape: tuple = (ty, tx)
+            Number of output points of a tile in each direction. Defaults to
+            (1024, 1024).
+        * overlap: int
+            Number of context points on each side of a tile. Defaults to 64.
+        * out: None, str or arrays
+            Where to write the results: None for in-memory arrays, a .npy path
+            for memory-mapped arrays, or preallocated arrays.
+        * params: keyword arguments
+            Parameters of the filter, e.g. n=1.5 for 'dz'.
+
+    Returns:
+        * result: 2d-array, or tuple of 2d-arrays for filters with several
+            outputs.
+    """
+
+    _, outputs = get_filter(name)
+    shape = np.shape(f)
+    geometry = as_geometry(x, y, shape)
+    arrays = None
+
+    for window, core, inner in tile_windows(shape, tile_shape, overlap):
+        results = run_filter(name, np.asarray(f[window]),
+                             geometry.window(window), **params)
+        if arrays is None:
+            arrays = open_outputs(out, outputs, shape, results[0].dtype)
+        for array, result in zip(arrays, results):
+            array[core] = result[inner]
+
+    for array in arrays:
+        if isinstance(array, np.memmap):
+            array.flush()
+
+    return arrays[0] if len(arrays) == 1 else tuple(arrays)
+
+def tiling_error(name, f, x, y=None, tile_shape=(1024, 1024), overlap=64,
+                 **params):
+    """
+    Measures the difference between the tiled and the whole-grid results of a
+    filter on a grid small enough to fit in memory, e.g. a sample of the
+    survey, to choose the overlap.
+
+    Arguments:
+        * name: str or callable
+            Name of a registered filter, or a filter function.
+        * f: 2d-array
+            Array with the data.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points.
+        * tile_shape: tuple = (ty, tx)
+            Number of output points of a tile in each direction.
+        * overlap: int
+            Number of context points on each side of a tile.
+        * params: keyword arguments
+            Parameters of the filter.
+
+    Returns:
+        * errors: list of floats
+            Maximum absolute difference of each output, relative to the
+            maximum absolute whole-grid value. Angles have no bound (see the
+            module documentation): their errors reach about 2 at any overlap.
+    """
+
+    geometry = as_geometry(x, y, np.shape(f))
+    whole = run_filter(name, f, geometry, **params)
+    tiled = apply_tiled(name, f, geometry, None, tile_shape, overlap, **params)
+    if len(whole) == 1:
+        tiled = (tiled,)
+
+    return [np.nanmax(np.abs(t - w)) / np.nanmax(np.abs(w))
+            for t, w in zip(tiled, whole)]
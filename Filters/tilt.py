@@ -11,7 +11,7 @@ import numpy as np
 from Filters.horizontal import dh
 from Filters.vertical import dz
 
-def tilt(f, x, y):
+def tilt(f, x=None, y=None, dfdh=None, dfdz=None):
     """
     Calculates the tilt angle, defined in terms of the ratio between the first
     vertical derivative to the horizontal derivative of a given field. For
@@ -29,26 +29,32 @@ def tilt(f, x, y):
         horizontal derivatives respectively.
 
     Arguments:
-        * f: 2d-array
-            Array with the data.
-        * x, y: 2d-arrays
-            Arrays with the x and y coordinates of the data points.
+        * f: 2d-array or SpectralGrid
+            Array with the data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * dfdh, dfdz: 2d-arrays
+            Optional total horizontal and first vertical derivatives, if
+            already calculated.
 
     Returns:
         * theta: 2d-array
             Array containing the tilt angle of the data.
     """
 
-    # calculate the horizontal and vertical derivatives
-    dfdh = dh(f, x, y)
-    dfdz = dz(f, x, y)
+    # calculate the horizontal and vertical derivatives, unless given
+    if dfdh is None:
+        dfdh = dh(f, x, y)
+    if dfdz is None:
+        dfdz = dz(f, x, y)
 
     # calculate the tilt (theta)
     theta = np.arctan(dfdz / dfdh)
 
     return theta
 
-def hyperbolic_tilt(f, x, y, k=0.25):
+def hyperbolic_tilt(f, x=None, y=None, k=0.25, dfdh=None, dfdz=None):
     """
     Calculates the hyperbolic tilt angle. For further details please refer to:
 
@@ -69,19 +75,27 @@ def hyperbolic_tilt(f, x, y, k=0.25):
         stabilizing the HTA when the denominator of the equation is small.
 
     Arguments:
-        * f: 2d-array
-            Array with the data.
-        * x, y: 2d-arrays
-            Arrays with the x and y coordinates of the data points.
+        * f: 2d-array or SpectralGrid
+            Array with the data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * k: float
+            Positive stabilizing constant. Defaults to 0.25.
+        * dfdh, dfdz: 2d-arrays
+            Optional total horizontal and first vertical derivatives, if
+            already calculated.
 
     Returns:
         * hta: 2d-array
             Array containing the hyperbolic tilt angle of the data.
     """
 
-    # calculate the horizontal and vertical derivatives
-    dfdh = dh(f, x, y)
-    dfdz = dz(f, x, y)
+    # calculate the horizontal and vertical derivatives, unless given
+    if dfdh is None:
+        dfdh = dh(f, x, y)
+    if dfdz is None:
+        dfdz = dz(f, x, y)
 
     # calculate the hyperbolic tilt angle
     hta = np.real(np.arctanh(dfdz / (dfdh + k)))
@@ -9,10 +9,11 @@
 """
 
 import numpy as np
-from Filters.horizontal import dxdy_conv
+from Filters.horizontal import dxdy
 from Filters.vertical import dz
 
-def dt(f, x, y):
+def dt(f, x=None, y=None, dfdx=None, dfdy=None, dfdz=None, method='conv',
+       stencil='gradient'):
     """
     Calculates the total derivative (often called the Analytic Signal). This is
     the vector sum of the partial derivatives in the x, y, and z directions.
@@ -23,19 +24,32 @@ def dt(f, x, y):
         the x, y, and z directions respectively.
 
     Arguments:
-        * f: 2d-array
-            Array with the data.
-        * x, y: 2d-arrays
-            Arrays with the x and y coordinates of the data points.
+        * f: 2d-array or SpectralGrid
+            Array with the data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * dfdx, dfdy, dfdz: 2d-arrays
+            Optional first-order partial derivatives in the x, y, and z
+            directions, if already calculated.
+        * method: str
+            'conv' to calculate the x and y derivatives with finite
+            differences, or 'fft' in the wavenumber domain (see
+            horizontal.dxdy). Defaults to 'conv'.
+        * stencil: str
+            Finite-difference stencil of the 'conv' method (see
+            horizontal.dxdy_conv). Defaults to 'gradient'.
 
     Returns:
         * dt: 2d-array
             Array with the total derivative.
     """
 
-    # calculate partial derivatives in the x, y, and z directions
-    dfdx, dfdy = dxdy_conv(f, x, y)
-    dfdz = dz(f, x, y)
+    # calculate partial derivatives in the x, y, and z directions, unless given
+    if dfdx is None or dfdy is None:
+        dfdx, dfdy = dxdy(f, x, y, 1, method, stencil)
+    if dfdz is None:
+        dfdz = dz(f, x, y)
 
     # calculate the total derivative
     dt = (dfdx**2 + dfdy**2 + dfdz**2)**0.5
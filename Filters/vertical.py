@@ -7,18 +7,19 @@
 """
 
 import numpy as np
-from Filters.horizontal import dxdy_conv
-from Filters.fft_processing import *
+from Filters.horizontal import dxdy
+from Filters.spectral import as_spectral_grid
 
-def dz(f, x, y, n=1):
+def dz(f, x=None, y=None, n=1):
     """
     Calculate the n-th partial derivative of 'f' in the z-direction.
 
     Arguments:
-        * f: 2d-array
-            Array with the gridded data.
-        * x, y: 2d-arrays
-            Arrays with the x and y coordinates of the data points.
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
         * n: float
             Order of the derivative to be taken.
             Must be positive number, may be non-integer for fractional
@@ -38,7 +39,7 @@ def dz(f, x, y, n=1):
 
     return dfdz
 
-def dz_laplace(f, x, y):
+def dz_laplace(f, x=None, y=None, method='conv', stencil='gradient'):
     """
     Calculate the second partial derivative of 'f' in the z-direction using the
     Laplace's equation in the spatial domain.
@@ -48,29 +49,34 @@ def dz_laplace(f, x, y):
         d2f/dz2 = - (d2f/dx2 + d2f/dy2)
 
     Arguments:
-        * f: 2d-array
-            Array with the gridded data.
-        * x, y: 2d-arrays
-            Arrays with the x and y coordinates of the data points.
-        * n: float
-            Order of the derivative to be taken.
-            Must be positive number, may be non-integer for fractional
-            derivatives.
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * method: str
+            'conv' to calculate the second-order horizontal derivatives with
+            finite differences, or 'fft' in the wavenumber domain (see
+            horizontal.dxdy). Defaults to 'conv'.
+        * stencil: str
+            Finite-difference stencil of the 'conv' method (see
+            horizontal.dxdy_conv). Defaults to 'gradient'.
 
     Returns:
         dfdz: 2d-array
-            Array of the n-th partial derivative of the data in the z direction.
+            Array of the second partial derivative of the data in the z
+            direction.
     """
 
-    # calculate second-order horizontal derivatives using convolution
-    dfdx, dfdy = dxdy_conv(f, x, y, 2)
+    # calculate second-order horizontal derivatives
+    dfdx, dfdy = dxdy(f, x, y, 2, method, stencil)
 
     # calulate second-order vertical derivative using Laplace's equation
     dfdz = - (dfdx + dfdy)
 
     return dfdz
 
-def dz_fft(f, x, y, n=1):
+def dz_fft(f, x=None, y=None, n=1):
     """
     Calculate the n-th partial derivative of 'f' in the z-direction using the
     Laplace's equation in the wavenumber domain.
@@ -89,10 +95,11 @@ def dz_fft(f, x, y, n=1):
         the derivative.
 
     Arguments:
-        * f: 2d-array
-            Array with the gridded data.
-        * x, y: 2d-arrays
-            Arrays with the x and y coordinates of the data points.
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
         * n: float
             Order of the derivative to be taken.
             Must be positive number, may be non-integer for fractional
@@ -103,17 +110,80 @@ def dz_fft(f, x, y, n=1):
             Array of the n-th partial derivative of the data in the z direction.
     """
 
-    # calculate Fourier Transform of data and associated wavenumbers
-    F, mask = fft_pad_data(f)
-    u, v = fft_wavenumbers(x, y, f.shape, mask.shape)
+    # calculate Fourier Transform of data and associated wavenumbers, unless
+    # a shared spectral context was given
+    grid = as_spectral_grid(f, x, y)
+
+    # calculate the derivative in the wavenumber domain and apply the Inverse
+    # Fourier Transform to get derivative in spatial domain
+    dfdz = grid.inverse(dz_kernel(grid, n))
 
-    # calculate the magnitude of the wavenumbers
-    freq = (u**2 + v**2)**(0.5)
+    return dfdz
+
+def dz_kernel(grid, n=1):
+    """
+    Returns the wavenumber-domain filter of the n-th vertical derivative,
+    (2*pi*|k|)^n, of a SpectralGrid (from its kernel cache). The wavenumbers
+    are in cycles per unit length, hence the 2*pi.
+    """
 
-    # calculate the derivative in the wavenumber domain
-    Fdfdz = F * freq**n
+    return grid.kernel('dz', lambda: (2 * np.pi * grid.r)**n, n)
 
-    # apply the Inverse Fourier Transform to get derivative in spatial domain
-    dfdz = ifft_unpad_data(Fdfdz, mask, f.shape)
+def dz_sweep(f, x=None, y=None, orders=(1, 1.5, 2), out=None):
+    """
+    Calculate the vertical derivatives of 'f' of several (fractional) orders
+    from a single Fourier Transform, e.g. to choose the order of a fractional
+    vertical derivative (Cooper G. R. J. and Cowan D. R., 2003, Sunshading
+    geophysical data using fractional order horizontal gradients, The Leading
+    Edge 22, 204-205).
+
+    The logarithm of the wavenumbers is calculated once, and the filter of
+    each order, (2*pi*|k|)^n = exp(n*log(2*pi*|k|)) as in dz_kernel, costs
+    one exponential and one inverse transform. Every order, n=2 included, is
+    calculated in the wavenumber domain (see dz_fft, unlike dz which uses
+    Laplace's equation for n=2).
 
-    return dfdz
+    Arguments:
+        * f: 2d-array or SpectralGrid
+            Array with the gridded data, or its shared spectral context.
+        * x, y: 2d-arrays, or GridGeometry and None
+            Arrays with the x and y coordinates of the data points. Not needed
+            when 'f' is a SpectralGrid.
+        * orders: list of floats
+            Orders of the derivatives. Must be positive numbers.
+        * out: None, str or array
+            Where to write the derivatives: None for an in-memory array, a
+            .npy path for a memory-mapped array, whose pages are only written
+            to disk and read back as needed, or a preallocated array.
+
+    Returns:
+        * dfdz: 3d-array
+            The derivatives, with shape (order, ny, nx), or (order, batch,
+            ny, nx) for a stack of grids.
+    """
+
+    grid = as_spectral_grid(f, x, y)
+
+    def build():
+        # log(2*pi*|k|), -inf at the zero wavenumber where the filter is 0
+        with np.errstate(divide='ignore'):
+            return np.log(2 * np.pi * grid.r)
+
+    log_r = grid.kernel('dz_log', build)
+
+    # imported here: tiling depends on the registry, which imports this module
+    from Filters.tiling import open_outputs
+
+    shape = (len(orders),) + tuple(grid.shape)
+    out = open_outputs(out, ('dz',), shape, grid.dtype)[0]
+
+    K = np.empty_like(log_r)
+    for i, n in enumerate(orders):
+        np.multiply(log_r, n, out=K)
+        np.exp(K, out=K)
+        out[i] = grid.inverse(K)
+
+    if isinstance(out, np.memmap):
+        out.flush()
+
+    return out
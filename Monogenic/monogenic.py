@@ -13,9 +13,13 @@
 
 from __future__ import division
 import numpy as np
+from Filters import fft_processing
+from Filters.spectral import as_spectral_grid
+from Filters.geometry import as_geometry
+from Filters import profiling
 
 
-def fft_wavenumbers(x, y, shape_dat, shape_pdat):
+def fft_wavenumbers(x, y, shape_dat, shape_pdat, real=False):
     """
     Calculates the u, v and r Fourier wavenumbers in the x, y and radial
     directions respectively.
@@ -23,38 +27,49 @@ def fft_wavenumbers(x, y, shape_dat, shape_pdat):
     Parameters:
 
     * x, v: 2d-arrays
-        Arrays with the x and y coordinates of the data points.
+        Arrays with the x and y coordinates of the data points, or a
+        GridGeometry as x (see Filters.geometry).
     * shape_dat: tube = (ny, nx)
         The number of data points in each direction before padding.
     * shape_pdat: tube = (ny, nx)
         The number of data points in each direction after padding.
+    * real: bool
+        Wavenumbers of the half-spectrum (see Filters.fft_processing).
 
     Returns:
 
     * u, v, r: 2d-arrays
-        x, y and radial Fourier wavenumbers.
+        x, y and radial Fourier wavenumbers, read-only (they are shared
+        through the kernel cache of Filters.cache).
 
     """
 
-    dx = (np.amax(x) - np.amin(x))/(shape_dat[1] - 1)
-    dy = (np.amax(y) - np.amin(y))/(shape_dat[0] - 1)
-    fx = np.fft.fftfreq(shape_pdat[1], dx)
-    fy = np.fft.fftfreq(shape_pdat[0], dy)
-    u, v = np.meshgrid(fx, fy)
-    r = np.sqrt(u**2 + v**2)
+    dx, dy = as_geometry(x, y, shape_dat).spacing
 
-    return u, v, r
+    return fft_processing.wavenumber_grids(dx, dy, shape_pdat, real)
 
 
-def riesz_to_attributes(vx, vy, vz):
+def riesz_to_attributes(vx, vy, vz, out=None, engine='numpy'):
     """
     Calculates the amplitude, phase and orientation of a given vector
     v = (vx, vy, vz).
 
+    The phase and orientation keep the published conventions,
+    arctan(sqrt(vx**2 + vy**2)/vz) in [-pi/2, pi/2] and arctan(vy/vx) in
+    [-pi/2, pi/2), but are calculated with arctan2, so no quotient is formed:
+    vz = 0 gives a phase of pi/2 and vx = vy = 0 an orientation of 0. The
+    input arrays are never modified, and the only full-size arrays written
+    are the three outputs.
+
     Parameters:
 
     * vx, vy, vz: 2d-arrays
         x, y and z components of the vector.
+    * out: tuple = (amp, phase, orientation)
+        Arrays to write the results to. None = new arrays.
+    * engine: str
+        'numpy' (in-place ufuncs) or 'numexpr' (fused, multi-threaded,
+        requires the numexpr package).
 
     Returns:
 
@@ -66,15 +81,55 @@ def riesz_to_attributes(vx, vy, vz):
         The vector orientation.
 
     """
-    vz[vz == 0] += 0.0000001
-    amp = np.sqrt(vx**2 + vy**2 + vz**2)
-    phase = np.arctan(np.sqrt(vx**2 + vy**2)/vz)
-    orient = np.arctan(vy/vx)
+    t = profiling.start()
+    if out is None:
+        dtype = np.result_type(vx, vy, vz, np.float32)
+        out = tuple(np.empty(np.shape(vz), dtype) for _ in range(3))
+    amp, phase, orient = out
+
+    if engine == 'numexpr':
+        import numexpr
+        numexpr.evaluate('sqrt(vx**2 + vy**2 + vz**2)', out=amp)
+        numexpr.evaluate('arctan2(where(vz < 0, -1, 1)*sqrt(vx**2 + vy**2),'
+                         ' abs(vz))', out=phase)
+        # the same fold into [-pi/2, pi/2) as below (numexpr's % is floored,
+        # and literal constants keep the precision of the arrays)
+        numexpr.evaluate('(arctan2(vy, vx) + %r) %% %r - %r'
+                         % (np.pi/2, np.pi, np.pi/2), out=orient)
+        profiling.stop('attributes', t)
+        return amp, phase, orient
+    if engine != 'numpy':
+        raise ValueError("Unknown engine '%s', expected 'numpy' or 'numexpr'"
+                         % engine)
+
+    # horizontal amplitude h (in phase) and amplitude, using the orientation
+    # array as scratch space. The squares are summed in place: potential-field
+    # values are far from overflowing, and np.hypot is several times slower.
+    np.multiply(vx, vx, out=amp)
+    np.multiply(vy, vy, out=phase)
+    np.add(amp, phase, out=amp)
+    np.sqrt(amp, out=phase)
+    np.multiply(vz, vz, out=orient)
+    np.add(amp, orient, out=amp)
+    np.sqrt(amp, out=amp)
+
+    # phase: arctan(h/vz) = arctan2(h*sign(vz), |vz|)
+    np.copysign(phase, vz, out=phase)
+    np.absolute(vz, out=orient)
+    np.arctan2(phase, orient, out=phase)
+
+    # orientation: arctan(vy/vx) is arctan2(vy, vx) folded into [-pi/2, pi/2)
+    np.arctan2(vy, vx, out=orient)
+    np.add(orient, np.pi/2, out=orient)
+    np.remainder(orient, np.pi, out=orient)
+    np.subtract(orient, np.pi/2, out=orient)
+    profiling.stop('attributes', t)
 
     return amp, phase, orient
 
 
-def fft_pad_data(data, shape_dat, n_points=10, mode='linear_ramp'):
+def fft_pad_data(data, shape_dat, n_points=10, mode='linear_ramp',
+                 real=False, backend=None, fast_len=False):
     """
     Padd data and calculates de FFT.
 
@@ -92,12 +147,21 @@ def fft_pad_data(data, shape_dat, n_points=10, mode='linear_ramp'):
            'edge': Pads with the edge values of the data.
            'mean': pads with the mean value of all the data.
                        }
+    * real: bool
+        Calculates only the half-spectrum with np.fft.rfft2.
+    * backend: str or backend object
+        FFT backend (see Filters.fft_backends). None = global default.
+    * fast_len: bool
+        Grows each direction to a fast FFT length, with at least pad_pt
+        padding points on each side (see Filters.fft_processing.pad_widths).
+
     Returns:
 
     * fpad: 2d-array
         The FFT of the padded data.
-    * mask: 2d-array
-        Location of padding points - {
+    * mask: PadDescriptor
+        Location of the data points (see Filters.fft_processing), which
+        converts to the mask of padding points - {
              True: data points.
              False: padded points.
                        }
@@ -106,18 +170,14 @@ def fft_pad_data(data, shape_dat, n_points=10, mode='linear_ramp'):
 
     """
 
-    data_p = np.pad(data, n_points, mode)
-
-    shape_pdat = (shape_dat[0] + 2*n_points, shape_dat[1] + 2*n_points)
+    fpdat, mask = fft_processing.fft_pad_data(data, n_points, mode, real,
+                                              backend, fast_len)
 
-    mask = np.zeros_like(data_p, dtype=bool)
-    mask[n_points:n_points+shape_dat[0], n_points:n_points+shape_dat[1]] = True
-    fpdat = np.fft.fft2(data_p)
+    return fpdat, mask, mask.shape
 
-    return fpdat, mask, shape_pdat
 
-
-def ifft_unpad_data(data_p, mask, shape_dat, shape_pdat):
+def ifft_unpad_data(data_p, mask, shape_dat, shape_pdat, real=False,
+                    backend=None):
     """
     Calculates de inverse Fourier Transform (iFFT) of a padded array and mask
     the data to the original shape.
@@ -126,8 +186,8 @@ def ifft_unpad_data(data_p, mask, shape_dat, shape_pdat):
 
     * data_p: 2d-array
         Array with the padded data.
-    * mask: 2d-array
-        Location of padding points - {
+    * mask: PadDescriptor or 2d-array
+        Location of the data points, or mask of padding points - {
              True: Points to be kept .
              False: Points to be removed.
                        }
@@ -135,6 +195,10 @@ def ifft_unpad_data(data_p, mask, shape_dat, shape_pdat):
         The number of data points in each direction before padding.
     * shape_pdat: tube = (ny, nx)
         The number of data points in each direction after padding.
+    * real: bool
+        data_p is a half-spectrum, inverted with np.fft.irfft2.
+    * backend: str or backend object
+        FFT backend (see Filters.fft_backends). None = global default.
 
     Returns:
 
@@ -143,13 +207,12 @@ def ifft_unpad_data(data_p, mask, shape_dat, shape_pdat):
 
     """
 
-    ifft_data = np.real(np.fft.ifft2(data_p))
-    data = ifft_data[mask]
-
-    return np.reshape(data, shape_dat)
+    return fft_processing.ifft_unpad_data(data_p, mask, shape_dat, real,
+                                          backend)
 
 
-def nss_monogenic_signal(x, y, data, pad_pt=10, pad_mode='linear_ramp'):
+def nss_monogenic_signal(x, y, data, pad_pt=10, pad_mode='linear_ramp',
+                         backend=None, fast_len=False, dtype=None):
     """
     Calculates the local amplitude, local phase and local orientation in the
     non-scale monogenic signal of data.
@@ -157,9 +220,14 @@ def nss_monogenic_signal(x, y, data, pad_pt=10, pad_mode='linear_ramp'):
     Parameters:
 
     * x, y: 2d-arrays
-        Arrays with the x and y coordinates of the data points.
-    * data: 2d-array
-        Array with the gridded data.
+        Arrays with the x and y coordinates of the data points, or a
+        GridGeometry as x (see Filters.geometry). Not needed when data is a
+        SpectralGrid.
+    * data: 2d-array, 3d-array or SpectralGrid
+        Array with the gridded data, a (batch, ny, nx) stack of grids with
+        the same geometry (the attributes are then stacked the same way), or
+        its shared spectral context (see Filters.spectral). A SpectralGrid
+        keeps its own padding.
     * pad_pt: int
         Number of array points to pad the data.
     * pad_mode: str
@@ -168,6 +236,14 @@ def nss_monogenic_signal(x, y, data, pad_pt=10, pad_mode='linear_ramp'):
            'edge': Pads with the edge values of data.
            'mean': pads with the mean value of all the data.
                        }
+    * backend: str or backend object
+        FFT backend (see Filters.fft_backends). None = global default.
+    * fast_len: bool
+        Grows each direction to a fast FFT length, with at least pad_pt
+        padding points on each side.
+    * dtype: data type
+        Precision of the calculation, np.float32 or np.float64 (see
+        Filters.fft_processing.float_type). None = precision of data.
 
     Returns:
 
@@ -180,31 +256,33 @@ def nss_monogenic_signal(x, y, data, pad_pt=10, pad_mode='linear_ramp'):
 
     """
 
-    shape_dat = np.shape(data)
+    # Data in the Fourier domain and Fourier wavenumbers
+    grid = as_spectral_grid(data, x, y, pad_pt, pad_mode,
+                            backend=backend, fast_len=fast_len, dtype=dtype)
 
-    # Data in the Fourier domain
-    F, mask, shape_pdat = fft_pad_data(data, shape_dat, pad_pt, pad_mode)
+    def kernels():
+        u, v = grid.u, grid.v
 
-    # Fourier wavenumbers
-    u, v, r = fft_wavenumbers(x, y, shape_dat, shape_pdat)
+        # Put 1 in r=0 to avoid singularity
+        r = np.where(grid.r == 0, 1, grid.r)
 
-    # Put 1 in r=0 to avoid singularity
-    r[r == 0] = 1
+        # Riesz components in the Wavenumber domain
+        return 1j*(u/r), 1j*(v/r)
 
-    # Riesz components in the Wavenumber domain
-    RX = 1j*(u/r)
-    RY = 1j*(v/r)
+    # Riesz kernels, built once per grid geometry
+    RX, RY = grid.kernel('nss', kernels)
 
     # Riesz components in the space domain
-    rx = ifft_unpad_data(RX*F, mask, shape_dat, shape_pdat)
-    ry = ifft_unpad_data(RY*F, mask, shape_dat, shape_pdat)
+    rx = grid.inverse(RX)
+    ry = grid.inverse(RY)
 
     # Returns the amplitude, phase and orientation
-    return riesz_to_attributes(rx, ry, data)
+    return riesz_to_attributes(rx, ry, grid.data)
 
 
 def pss_monogenic_signal(x, y, data, hc=None, hf=None,
-                         pad_pt=10, pad_mode='linear_ramp'):
+                         pad_pt=10, pad_mode='linear_ramp', backend=None,
+                         fast_len=False, dtype=None):
     """
     Calculates the local amplitude, local phase and local orientation in the
     Poisson scale-space monogenic signal of data.
@@ -212,9 +290,14 @@ def pss_monogenic_signal(x, y, data, hc=None, hf=None,
     Parameters:
 
     * x, y: 2d-arrays
-        Arrays with the x and y coordinates of the data points.
-    * data: 2d-array
-        Array with the gridded data.
+        Arrays with the x and y coordinates of the data points, or a
+        GridGeometry as x (see Filters.geometry). Not needed when data is a
+        SpectralGrid.
+    * data: 2d-array, 3d-array or SpectralGrid
+        Array with the gridded data, a (batch, ny, nx) stack of grids with
+        the same geometry (the attributes are then stacked the same way), or
+        its shared spectral context (see Filters.spectral). A SpectralGrid
+        keeps its own padding.
     * pad_pt: int
         Number of array points to pad the data.
     * pad_mode: str
@@ -229,6 +312,14 @@ def pss_monogenic_signal(x, y, data, hc=None, hf=None,
     * hf: float
         The fine Poisson scale-space parameter.
         None = default parameters calculation.
+    * backend: str or backend object
+        FFT backend (see Filters.fft_backends). None = global default.
+    * fast_len: bool
+        Grows each direction to a fast FFT length, with at least pad_pt
+        padding points on each side.
+    * dtype: data type
+        Precision of the calculation, np.float32 or np.float64 (see
+        Filters.fft_processing.float_type). None = precision of data.
 
     Returns:
 
@@ -241,37 +332,134 @@ def pss_monogenic_signal(x, y, data, hc=None, hf=None,
 
     """
 
-    shape_dat = np.shape(data)
-
-    # Data in the Fourier domain
-    F, mask, shape_pdat = fft_pad_data(data, shape_dat, pad_pt, pad_mode)
-
-    # Fourier wavenumbers
-    u, v, r = fft_wavenumbers(x, y, shape_dat, shape_pdat)
+    # Data in the Fourier domain and Fourier wavenumbers
+    grid = as_spectral_grid(data, x, y, pad_pt, pad_mode,
+                            backend=backend, fast_len=fast_len, dtype=dtype)
 
     # Setting defaults parameters
     if hc is None:
-        shape = np.shape(data)
-        dx = (np.max(x) - np.min(x))/(shape[1] - 1)
-        dy = (np.max(x) - np.min(x))/(shape[0] - 1)
-        hc = np.amin([dx, dy])
+        hc = np.amin([grid.dx, grid.dy])
     if hf is None:
         hf = 0.9*hc
 
-    # Scale-space filter kernel
-    p = np.exp(-2.*np.pi*r*hf) - np.exp(-2.*np.pi*r*hc)
+    def kernels():
+        u, v, r = grid.u, grid.v, grid.r
 
-    # Put 1 in r=0 to avoid singularity
-    r[r == 0] = 1
+        # Scale-space filter kernel
+        p = np.exp(-2.*np.pi*r*hf) - np.exp(-2.*np.pi*r*hc)
 
-    # Riesz components in the Wavenumber domain
-    RX = 1j*(u/r)*p
-    RY = 1j*(v/r)*p
+        # Put 1 in r=0 to avoid singularity
+        r = np.where(r == 0, 1, r)
+
+        # Riesz components in the Wavenumber domain
+        return p, 1j*(u/r)*p, 1j*(v/r)*p
+
+    # Scale-space and Riesz kernels, built once per grid geometry and scale
+    p, RX, RY = grid.kernel('pss', kernels, hc, hf)
 
     # Riesz components and data in the Poisson scale-space in the space domain
-    fbp = ifft_unpad_data(p*F,  mask, shape_dat, shape_pdat)
-    rxp = ifft_unpad_data(RX*F, mask, shape_dat, shape_pdat)
-    ryp = ifft_unpad_data(RY*F, mask, shape_dat, shape_pdat)
+    fbp = grid.inverse(p)
+    rxp = grid.inverse(RX)
+    ryp = grid.inverse(RY)
 
     # Amplitude, phase and orientation in the Poisson scale-space
     return riesz_to_attributes(rxp, ryp, fbp)
+
+
+def pss_monogenic_stack(x, y, data, scales, chunk=None, pad_pt=10,
+                        pad_mode='linear_ramp', backend=None, fast_len=False,
+                        dtype=None):
+    """
+    Calculates the local amplitude, local phase and local orientation in the
+    Poisson scale-space monogenic signal of data at several scales, from a
+    single Fourier Transform of the data.
+
+    The band-pass kernels of all the scales in a chunk are evaluated together
+    as a (scale, ky, kx) array and inverted together.
+
+    Parameters:
+
+    * x, y: 2d-arrays
+        Arrays with the x and y coordinates of the data points, or a
+        GridGeometry as x (see Filters.geometry). Not needed when data is a
+        SpectralGrid.
+    * data: 2d-array or SpectralGrid
+        Array with the gridded data, or its shared spectral context (see
+        Filters.spectral). A SpectralGrid keeps its own padding.
+    * scales: list
+        The Poisson scale-space parameters of each scale, as (hc, hf) pairs,
+        or as coarse parameters hc alone (then hf = 0.9*hc, as in
+        pss_monogenic_signal).
+    * chunk: int
+        Number of scales calculated at once, bounding the memory to about
+        5*chunk spectra. None = all the scales at once.
+    * pad_pt: int
+        Number of array points to pad the data.
+    * pad_mode: str
+        Padding mode (see pss_monogenic_signal).
+    * backend: str or backend object
+        FFT backend (see Filters.fft_backends). None = global default.
+    * fast_len: bool
+        Grows each direction to a fast FFT length, with at least pad_pt
+        padding points on each side.
+    * dtype: data type
+        Precision of the calculation, np.float32 or np.float64 (see
+        Filters.fft_processing.float_type). None = precision of data.
+
+    Returns:
+
+    * amplitude: 3d-array
+        The local amplitude, with shape (scale, ny, nx).
+    * phase: 3d-array
+        The local phase, with shape (scale, ny, nx).
+    * orientation: 3d-array
+        The local orientation, with shape (scale, ny, nx).
+
+    """
+
+    # Data in the Fourier domain and Fourier wavenumbers
+    grid = as_spectral_grid(data, x, y, pad_pt, pad_mode,
+                            backend=backend, fast_len=fast_len, dtype=dtype)
+    if len(grid.shape) != 2:
+        raise ValueError('pss_monogenic_stack expects a single grid, not a '
+                         'stack of grids')
+
+    # Coarse and fine parameters of every scale
+    hc = np.array([np.ravel(s)[0] for s in scales], dtype=float)
+    hf = np.array([np.ravel(s)[1] if np.size(s) > 1 else 0.9*np.ravel(s)[0]
+                   for s in scales], dtype=float)
+    chunk = chunk or len(hc)
+
+    def riesz():
+        # Put 1 in r=0 to avoid singularity
+        r = np.where(grid.r == 0, 1, grid.r)
+
+        # Riesz components in the Wavenumber domain
+        return 1j*(grid.u/r), 1j*(grid.v/r)
+
+    rx, ry = grid.kernel('riesz', riesz)
+
+    amp, phase, orient = [np.empty((len(hc),) + grid.shape, grid.dtype)
+                          for _ in range(3)]
+    for i in range(0, len(hc), chunk):
+        s = slice(i, i + chunk)
+
+        def kernels():
+            r = grid.r[np.newaxis]
+            c = hc[s, np.newaxis, np.newaxis]
+            f = hf[s, np.newaxis, np.newaxis]
+
+            # Scale-space filter kernels of the chunk
+            return np.exp(-2.*np.pi*r*f) - np.exp(-2.*np.pi*r*c)
+
+        p = grid.kernel('pss_stack', kernels, tuple(hc[s]), tuple(hf[s]))
+
+        # Riesz components and data in the Poisson scale-space in the space
+        # domain, for every scale of the chunk
+        fbp = grid.inverse(p)
+        rxp = grid.inverse(rx*p)
+        ryp = grid.inverse(ry*p)
+
+        riesz_to_attributes(rxp, ryp, fbp, out=(amp[s], phase[s], orient[s]))
+
+    return amp, phase, orient
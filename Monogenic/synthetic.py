@@ -9,11 +9,19 @@
     http://software.seg.org/2017/0002
 """
 
-import numpy as np
+import os
+import sys
+import functools
 
 import matplotlib.pyplot as plt
 
-from monogenic import nss_monogenic_signal, pss_monogenic_signal
+# run from any directory, e.g. 'python Monogenic/synthetic.py'
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from Monogenic.monogenic import nss_monogenic_signal, pss_monogenic_signal
+from Filters.gridio import open_grid
+from Filters.render import render_figures
 
 
 def plot_edges(size):
@@ -64,65 +72,33 @@ def plot_edges(size):
              linestyle='--')
 
 
-def plot_monogenic(attributes, titles):
-    # Plotting the attributes of the Monogenic Signal
-    plt.figure(figsize=(20, 5))
-    for i, par in enumerate(attributes):
-        plt.subplot(1, 3, i + 1)
-        plt.title(title[i])
-        plt.gca().set_aspect('equal', adjustable='box')
-        plt.contourf(yp/1000., xp/1000., par, 50, cmap=plt.cm.RdBu_r)
-        cb = plt.colorbar(pad=0.05)
-        if i:
-            cb.set_label("Radians", labelpad=5, rotation=90)
-        else:
-            cb.set_label("nT", labelpad=5, rotation=90)
-        plt.xlabel('Easting Coordinate (km)')
-        plt.ylabel('Northing Coordinate (km)')
-        plot_edges(2)
-        plt.show()
-
-# Open File "data.dat" and import data
-data = np.loadtxt("data.dat")
-xp = data[:, 0]
-yp = data[:, 1]
-zp = data[:, 2]
-tf = data[:, 3]
-
-grd_shape = (200, 200)
-
-xp = np.reshape(xp, grd_shape)
-yp = np.reshape(yp, grd_shape)
-zp = np.reshape(zp, grd_shape)
-tf = np.reshape(tf, grd_shape)
-
-# Calculating the Non-scale-space Monogenic Signal Attributes
-nss_filters = nss_monogenic_signal(xp, yp, tf, pad_pt=10,
-                                   pad_mode="linear_ramp")
-
-# Calculating the Poisson scale-space Monogenic Signal Attributes
-pss_filters = pss_monogenic_signal(xp, yp, tf, hc=500, hf=450,
-                                   pad_pt=10, pad_mode='mean', )
-
-# Plotting the total-field anomaly
-plt.figure(figsize=(10, 10))
-plt.title('Total Field Anomaly')
-plt.gca().set_aspect('equal', adjustable='box')
-plt.contourf(yp/1000, xp/1000, tf, 50, cmap=plt.cm.RdBu_r)
-cb = plt.colorbar()
-cb.set_label("nT", labelpad=30, rotation=0)
-plt.xlabel('Easting Coordinate (km)')
-plt.ylabel('Northing Coordinate (km)')
-plot_edges(3)
-plt.show()
-
-# Plotting the monogenic signal attributes
-title = ["a) Non-scale Amplitude", "b) Non-scale Phase",
-         "c) Non-scale Orientation"]
-
-plot_monogenic(nss_filters, title)
-
-title = ["a) Poisson Scale-Space Amplitude", "b) Poisson Scale-Space Phase",
-         "c) Poisson Scale-Space Orientation"]
-
-plot_monogenic(pss_filters, title)
+if __name__ == '__main__':
+    # Open File "data.dat" beside this script (converted to a binary grid on
+    # first use)
+    tf, geometry = open_grid(os.path.join(HERE, "data.dat"))
+
+    # Calculating the Non-scale-space Monogenic Signal Attributes
+    nss_filters = nss_monogenic_signal(geometry, None, tf, pad_pt=10,
+                                       pad_mode="linear_ramp")
+
+    # Calculating the Poisson scale-space Monogenic Signal Attributes
+    pss_filters = pss_monogenic_signal(geometry, None, tf, hc=500, hf=450,
+                                       pad_pt=10, pad_mode='mean', )
+
+    # Plotting the total-field anomaly and the monogenic signal attributes,
+    # saved as images rendered concurrently
+    nss_titles = ["a) Non-scale Amplitude", "b) Non-scale Phase",
+                  "c) Non-scale Orientation"]
+    pss_titles = ["a) Poisson Scale-Space Amplitude",
+                  "b) Poisson Scale-Space Phase",
+                  "c) Poisson Scale-Space Orientation"]
+    labels = ["nT", "Radians", "Radians"]
+
+    figures = [
+        ('Total Field.png', [(tf, 'Total Field Anomaly', 'nT')],
+         {'size': (10, 10), 'overlay': functools.partial(plot_edges, 3)}),
+        ('nss.png', list(zip(nss_filters, nss_titles, labels))),
+        ('pss.png', list(zip(pss_filters, pss_titles, labels))),
+    ]
+    render_figures(figures, geometry, size=(20, 5),
+                   overlay=functools.partial(plot_edges, 2))
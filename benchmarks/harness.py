@@ -0,0 +1,293 @@
+"""
+    Benchmark Harness
+
+    A Python program to time and memory-profile every filter on synthetic
+    grids of increasing size, and to compare the results between commits.
+
+    The synthetic grids reuse the geometry and noise model of data.dat: the
+    anomaly is mirrored into a seamless periodic tile, repeated to the
+    requested size, and white noise with the standard deviation estimated
+    from data.dat is added.
+
+    Each filter and size runs in a fresh process, so the peak resident memory
+    (RSS) reported is that of the filter alone, on top of the loaded grid.
+
+    Usage:
+
+        python -m benchmarks.harness run --sizes 200 400 800 --out new.json
+        python -m benchmarks.harness compare old.json new.json
+
+    Author: Joshua Poirier, 2017
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Filters import gridio
+from Filters.geometry import as_geometry, GridGeometry
+from Filters.registry import run_filter, filter_label, filter_specs
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, 'Filters', 'data.dat')
+
+# the benchmarked filters, as (name, params) pairs (see Filters.registry)
+FILTERS = ['dz', ('dz', {'n': 1.5}), ('dz', {'n': 2}), 'dh', 'dt', 'tilt',
+           'hta', 'dx', 'dy', 'nss', 'pss']
+
+SIZES = [200, 400, 800, 1600, 3200]
+
+def noise_level(f):
+    """
+    Estimates the standard deviation of the white noise of a grid from its
+    second differences along the rows (6 times the noise variance for white
+    noise, while a smooth anomaly contributes little).
+    """
+
+    return np.std(np.diff(f, 2, axis=1)) / 6**0.5
+
+def synthetic_grid(n, template=TEMPLATE, seed=0):
+    """
+    Generates a synthetic survey of n by n points with the sample spacing and
+    noise level of a template survey.
+
+    Arguments:
+        * n: int
+            Number of points in each direction.
+        * template: str
+            Path of the template survey. Defaults to data.dat.
+        * seed: int
+            Seed of the noise generator. Defaults to 0.
+
+    Returns:
+        * f: 2d-array
+            The synthetic total-field anomaly.
+        * geometry: GridGeometry
+            Its origin, sample spacing and shape.
+    """
+
+    x, y, _, tf = gridio.read_dat(template)
+    template = as_geometry(x, y)
+
+    # mirror the anomaly into a periodic tile, so repetitions have no seams
+    tile = np.block([[tf, tf[:, ::-1]], [tf[::-1], tf[::-1, ::-1]]])
+    reps = (-(-n // tile.shape[0]), -(-n // tile.shape[1]))
+    f = np.tile(tile, reps)[:n, :n]
+
+    rng = np.random.default_rng(seed)
+    f = f + rng.normal(0, noise_level(tf), f.shape)
+
+    return f, GridGeometry(template.origin, template.spacing, f.shape)
+
+def peak_rss():
+    """
+    Returns the peak resident memory of the process, in bytes.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def measure(path, geometry, name, params, repeat):
+    """
+    Worker task: loads a grid and times a filter on it.
+
+    Returns:
+        * result: dict
+            The best and first ('cold', building the kernels) run times in
+            seconds, the peak RSS and its increase over the loaded grid, in
+            bytes.
+    """
+
+    f = np.load(path)
+    before = peak_rss()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_filter(name, f, geometry, **params)
+        times.append(time.perf_counter() - start)
+    peak = peak_rss()
+
+    return {'seconds': min(times), 'cold_seconds': times[0],
+            'peak_rss': peak, 'filter_rss': peak - before}
+
+def scaling_exponent(pixels, seconds):
+    """
+    Fits time ~ pixels**k over the sizes of a filter and returns k (1 for a
+    linear cost, slightly above 1 for FFT-based filters).
+    """
+
+    if len(pixels) < 2:
+        return None
+
+    return float(np.polyfit(np.log(pixels), np.log(seconds), 1)[0])
+
+def git_commit():
+    """
+    Returns the commit of the working tree, if it is a git repository.
+    """
+
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes=SIZES, filters=FILTERS, repeat=3, template=TEMPLATE,
+                   verbose=True):
+    """
+    Times and memory-profiles a suite of filters on synthetic grids.
+
+    Arguments:
+        * sizes: list of int
+            Number of points in each direction of the grids, e.g. 200 up to
+            16384.
+        * filters: list
+            Filter names, or (name, params) pairs.
+        * repeat: int
+            Number of runs of each filter on each grid. Defaults to 3.
+        * template: str
+            Path of the template survey. Defaults to data.dat.
+        * verbose: bool
+            Print each result. Defaults to True.
+
+    Returns:
+        * report: dict
+            The environment ('meta'), one entry per filter and size
+            ('results') and the scaling exponent of each filter ('scaling').
+    """
+
+    specs = filter_specs(filters)
+    results = []
+    tmp = tempfile.mkdtemp()
+    context = multiprocessing.get_context('spawn')
+
+    try:
+        for n in sizes:
+            f, geometry = synthetic_grid(n, template)
+            path = os.path.join(tmp, 'grid.npy')
+            np.save(path, f)
+            del f
+
+            for name, params in specs:
+                with ProcessPoolExecutor(1, mp_context=context) as pool:
+                    result = pool.submit(measure, path, geometry, name, params,
+                                         repeat).result()
+                result.update(filter=filter_label(name, params), size=n,
+                              pixels=n*n)
+                result['mpixels_per_s'] = n*n / 1e6 / result['seconds']
+                results.append(result)
+                if verbose:
+                    print('%-16s %6d  %9.4f s  %8.2f Mpix/s  %8.1f MiB'
+                          % (result['filter'], n, result['seconds'],
+                             result['mpixels_per_s'],
+                             result['filter_rss'] / 2.**20))
+    finally:
+        shutil.rmtree(tmp)
+
+    scaling = {}
+    for label in sorted(set(r['filter'] for r in results)):
+        runs = [r for r in results if r['filter'] == label]
+        scaling[label] = scaling_exponent([r['pixels'] for r in runs],
+                                          [r['seconds'] for r in runs])
+
+    meta = {'commit': git_commit(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'repeat': repeat}
+
+    return {'meta': meta, 'results': results, 'scaling': scaling}
+
+def compare(old, new, threshold=0.1):
+    """
+    Compares two benchmark reports.
+
+    Arguments:
+        * old, new: dict
+            Benchmark reports (see run_benchmarks).
+        * threshold: float
+            Relative change of the run time reported as a regression or an
+            improvement. Defaults to 0.1 (10%).
+
+    Returns:
+        * rows: list of dicts
+            The filter, size, both run times, their ratio (new / old) and the
+            verdict ('slower', 'faster' or 'same') of each common entry.
+    """
+
+    before = dict(((r['filter'], r['size']), r) for r in old['results'])
+    rows = []
+    for r in new['results']:
+        key = (r['filter'], r['size'])
+        if key not in before:
+            continue
+        ratio = r['seconds'] / before[key]['seconds']
+        verdict = ('slower' if ratio > 1 + threshold else
+                   'faster' if ratio < 1 - threshold else 'same')
+        rows.append({'filter': key[0], 'size': key[1],
+                     'old_seconds': before[key]['seconds'],
+                     'new_seconds': r['seconds'], 'ratio': ratio,
+                     'old_rss': before[key]['filter_rss'],
+                     'new_rss': r['filter_rss'], 'verdict': verdict})
+
+    return rows
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the filters on synthetic grids.')
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='run the benchmarks')
+    run.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    run.add_argument('--filters', nargs='+',
+                     help='registered filter names (defaults to all)')
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--template', default=TEMPLATE)
+    run.add_argument('--out', help='JSON file for the results')
+
+    cmp = commands.add_parser('compare', help='compare two result files')
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run_benchmarks(args.sizes, args.filters or FILTERS,
+                                args.repeat, args.template)
+        for label, k in sorted(report['scaling'].items()):
+            print('%-16s scaling exponent %s'
+                  % (label, 'n/a' if k is None else '%.2f' % k))
+        if args.out:
+            with open(args.out, 'w') as fh:
+                json.dump(report, fh, indent=2)
+    elif args.command == 'compare':
+        with open(args.old) as fh:
+            old = json.load(fh)
+        with open(args.new) as fh:
+            new = json.load(fh)
+        rows = compare(old, new, args.threshold)
+        for row in rows:
+            print('%-16s %6d  %9.4f s -> %9.4f s  x%.2f  %s'
+                  % (row['filter'], row['size'], row['old_seconds'],
+                     row['new_seconds'], row['ratio'], row['verdict']))
+        return 1 if any(row['verdict'] == 'slower' for row in rows) else 0
+    else:
+        parser.print_help()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
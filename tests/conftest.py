@@ -0,0 +1,6 @@
+import os
+import sys
+
+# run from any directory, as the scripts do
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
@@ -0,0 +1,42 @@
+import os
+import numpy as np
+from Filters.cache import ResultCache
+from Filters.gridio import open_grid
+from Filters.registry import run_filter
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'Filters', 'data.dat')
+
+def test_digest_read_only_view_of_writable_array(tmp_path):
+    # the view cannot be written, but its base can: never memoized
+    cache = ResultCache(str(tmp_path))
+    a = np.ones(10)
+    v = a.view()
+    v.flags.writeable = False
+    before = cache.digest(v)
+    a[:] = 2
+    assert cache.digest(v) != before
+
+def test_digest_immutable_arrays_are_memoized(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    a = np.ones(10)
+    a.flags.writeable = False
+    cache.digest(a)
+    assert id(a) in cache._digests
+
+    tf, _ = open_grid(DATA)
+    cache.digest(tf)
+    assert id(tf) in cache._digests
+
+def test_memory_layer_is_independent_of_results(tmp_path):
+    cache = ResultCache(str(tmp_path), memory_bytes=2**26)
+    tf, geometry = open_grid(DATA)
+    expected, = run_filter('dz', tf, geometry)
+
+    result, = run_filter('dz', tf, geometry, cache=cache)
+    assert result.flags.writeable
+    result[...] = 0
+
+    cached, = run_filter('dz', tf, geometry, cache=cache)
+    assert cache.hits == 1
+    np.testing.assert_array_equal(cached, expected)
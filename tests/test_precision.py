@@ -0,0 +1,29 @@
+import os
+import pytest
+from Filters.gridio import open_grid
+from Filters.registry import precision_error
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'Filters', 'data.dat')
+
+# single-precision error bounds (see registry.precision_error)
+LINEAR = 1e-5
+ANGLE = 2e-4
+
+@pytest.mark.parametrize('name, params, bounds', [
+    ('dz', {}, [LINEAR]),
+    ('dz', {'n': 1.5}, [LINEAR]),
+    ('dz', {'n': 2}, [LINEAR]),
+    ('dh', {}, [LINEAR]),
+    ('dt', {}, [LINEAR]),
+    ('tilt', {}, [ANGLE]),
+    ('hta', {}, [ANGLE]),
+    ('nss', {}, [LINEAR, ANGLE, ANGLE]),
+    ('pss', {'hc': 500, 'hf': 450}, [LINEAR, ANGLE, ANGLE]),
+])
+def test_single_precision(name, params, bounds):
+    tf, geometry = open_grid(DATA)
+    errors = precision_error(name, tf, geometry, **params)
+    assert len(errors) == len(bounds)
+    for error, bound in zip(errors, bounds):
+        assert error < bound